@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+# Token bucket kept in a Redis hash. Time comes from the Redis server so every
+# replica refills the same bucket against the same clock.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate / 1000)
+
+local granted = math.min(cost, math.floor(tokens))
+tokens = tokens - granted
+local retry_after_ms = 0
+if granted < cost then
+    retry_after_ms = math.ceil((1 - tokens) * 1000 / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return {granted, retry_after_ms}
+"""
+
+
+class UserRateLimiter:
+    """Per-user token bucket shared by every replica through Redis.
+
+    allow() charges one token per request and admits as many of the cost
+    requests as there are whole tokens, so a batch gets through only as far
+    as the user's budget reaches. Fails open: if Redis is unavailable the request is admitted, since the
+    rate governor still protects the upstream quota.
+    """
+
+    def __init__(self, capacity: int, per_minute: int, on_error: Callable[[Exception], None] = lambda e: None):
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.on_error = on_error
+        self._script: Optional[aioredis.client.AsyncScript] = None
+        self._client: Optional[aioredis.Redis] = None
+
+    async def allow(self, client: Optional[aioredis.Redis], user_id: str, cost: int = 1) -> tuple[int, float]:
+        """Returns how many of cost requests are admitted, and when the next token is due if not all were."""
+        if client is None:
+            return cost, 0.0
+
+        if self._script is None or self._client is not client:
+            self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+            self._client = client
+
+        try:
+            granted, retry_after_ms = await self._script(
+                keys=[f"gemini:ratelimit:user:{user_id}"],
+                args=[self.capacity, self.rate, cost]
+            )
+        except redis.RedisError as e:
+            self.on_error(e)
+            logger.error("Rate limiter error, admitting request: %s", e)
+            return cost, 0.0
+
+        return int(granted), retry_after_ms / 1000
+
+
+class FairScheduler:
+    """Concurrency limiter that hands free slots to waiting users round-robin.
+
+    Behaves like a semaphore, except that waiters are grouped per user and
+    each released slot goes to the next user in rotation. A user with
+    hundreds of queued calls therefore gets one slot per turn, the same as a
+    user with one.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.available = concurrency
+        self._queues: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @asynccontextmanager
+    async def slot(self, user_id: str) -> AsyncIterator[None]:
+        await self._acquire(user_id)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, user_id: str):
+        if self.available > 0 and not self._queues:
+            self.available -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the cancellation landed.
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        while self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self.available += 1
@@ -0,0 +1,130 @@
+"""Effective Redis cache capacity and bytes on the wire with compact, compressed storage.
+
+Run from the repository root:
+
+    python -m benchmarks.cache_capacity
+
+Builds a corpus of LLM-style answers from real English prose (docstrings
+from the standard library, arranged into paragraphs and bullet lists, with
+lognormally distributed lengths). For each answer it compares:
+
+  * Redis value bytes as a plain UTF-8 string vs. the cache envelope, and
+    how many entries fit in --maxmemory as a result, using an estimated
+    per-key overhead
+  * encode and decode time per entry
+  * /chat and /history response bodies with and without gzip
+"""
+import argparse
+import gzip
+import inspect
+import json
+import math
+import pkgutil
+import random
+import statistics
+import time
+
+import cache_envelope
+
+# dictEntry, robj and SDS headers plus the key itself ("gemini:response:" + 32 hex chars)
+REDIS_KEY_OVERHEAD_BYTES = 72 + 48
+
+
+def load_paragraphs() -> list[str]:
+    import asyncio
+    import collections
+    import email
+    import http
+    import json as json_module
+    import logging
+
+    paragraphs = []
+    for package in (asyncio, collections, email, http, json_module, logging):
+        names = [package.__name__] + [
+            f"{package.__name__}.{m.name}" for m in pkgutil.iter_modules(getattr(package, "__path__", []))
+            if m.name != "__main__"
+        ]
+        for name in names:
+            try:
+                module = __import__(name, fromlist=["_"])
+            except Exception:
+                continue
+            for _, obj in inspect.getmembers(module):
+                doc = inspect.getdoc(obj)
+                if doc:
+                    paragraphs.extend(p.replace("\n", " ") for p in doc.split("\n\n") if len(p) > 80)
+    return sorted(set(paragraphs))
+
+
+def build_answer(rng: random.Random, paragraphs: list[str], target: int) -> str:
+    parts = []
+    while sum(map(len, parts)) < target:
+        paragraph = rng.choice(paragraphs)
+        if rng.random() < 0.3:
+            sentences = [s.strip() for s in paragraph.split(". ") if s.strip()]
+            parts.append("\n".join(f"- {s}" for s in sentences[:5]))
+        elif rng.random() < 0.1:
+            parts.append(f"## {paragraph[:40].strip()}")
+        else:
+            parts.append(paragraph)
+    return "\n\n".join(parts)[:target]
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    paragraphs = load_paragraphs()
+    answers = [
+        build_answer(rng, paragraphs, max(40, int(rng.lognormvariate(math.log(args.mean_length) - 0.32, 0.8))))
+        for _ in range(args.entries)
+    ]
+    metadata = {"model": "models/gemini-flash-latest", "input_tokens": 24, "output_tokens": 300}
+
+    raw_sizes = [len(a.encode("utf-8")) for a in answers]
+    start = time.perf_counter()
+    envelopes = [cache_envelope.encode_entry(a, metadata, threshold=args.threshold, level=args.level) for a in answers]
+    encode_us = (time.perf_counter() - start) / len(answers) * 1e6
+    start = time.perf_counter()
+    decoded = [cache_envelope.decode_entry(e).text for e in envelopes]
+    decode_us = (time.perf_counter() - start) / len(answers) * 1e6
+    assert decoded == answers
+
+    stored_sizes = [len(e) for e in envelopes]
+    raw_per_key = statistics.mean(raw_sizes) + REDIS_KEY_OVERHEAD_BYTES
+    stored_per_key = statistics.mean(stored_sizes) + REDIS_KEY_OVERHEAD_BYTES
+    maxmemory = args.maxmemory_mb * 1024 * 1024
+
+    print(f"corpus: {len(answers)} answers, median {statistics.median(raw_sizes):.0f} B, "
+          f"mean {statistics.mean(raw_sizes):.0f} B, max {max(raw_sizes)} B")
+    print(f"compression threshold {args.threshold} B, zlib level {args.level}")
+    print()
+    print(f"{'storage':>10} {'mean value B':>13} {'entries in ' + str(args.maxmemory_mb) + 'MB':>17} {'encode us':>10} {'decode us':>10}")
+    print(f"{'plain':>10} {statistics.mean(raw_sizes):>13.0f} {maxmemory / raw_per_key:>17.0f} {'-':>10} {'-':>10}")
+    print(f"{'envelope':>10} {statistics.mean(stored_sizes):>13.0f} {maxmemory / stored_per_key:>17.0f} "
+          f"{encode_us:>10.1f} {decode_us:>10.1f}")
+
+    chat_bodies = [json.dumps({"response": a}).encode("utf-8") for a in answers]
+    history_bodies = [
+        json.dumps({"messages": [{"id": f"{i}-0", "role": "assistant", "content": a, "user_id": "user_us_1",
+                                  "timestamp": "2026-01-01T00:00:00"} for i, a in enumerate(answers[j:j + 50])]}).encode("utf-8")
+        for j in range(0, len(answers) - 50, 50)
+    ]
+
+    print()
+    print(f"{'endpoint':>10} {'bodies':>7} {'identity KB':>12} {'gzip KB':>9} {'saved':>7}")
+    for name, bodies in (("/chat", chat_bodies), ("/history", history_bodies)):
+        identity = sum(len(b) for b in bodies)
+        # Bodies under the middleware's minimum size are sent uncompressed.
+        compressed = sum(len(gzip.compress(b, args.level)) if len(b) >= args.gzip_minimum else len(b) for b in bodies)
+        print(f"{name:>10} {len(bodies):>7} {identity / 1024:>12.0f} {compressed / 1024:>9.0f} {1 - compressed / identity:>7.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--mean-length", type=int, default=1800, help="Mean answer length in characters")
+    parser.add_argument("--threshold", type=int, default=512)
+    parser.add_argument("--level", type=int, default=6)
+    parser.add_argument("--gzip-minimum", type=int, default=1000)
+    parser.add_argument("--maxmemory-mb", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=5)
+    run(parser.parse_args())
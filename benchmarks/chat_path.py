@@ -0,0 +1,142 @@
+"""Requests/sec through the full chat path with the fake model, with regression checks.
+
+Run from the repository root:
+
+    python -m benchmarks.chat_path --save benchmarks/baseline.json
+    python -m benchmarks.chat_path --compare benchmarks/baseline.json
+
+Every request goes through the ASGI app: routing and validation, the
+jailbreak check, admission, the cache, the model call, history and metrics.
+The fake model answers instantly by default, so the numbers measure the
+app's own overhead per request. Redis is bypassed, so cache hits are served
+from L1.
+
+Scenarios: blocked prompts, cache hits, cache misses (a unique prompt per
+request), and streamed cache misses. With --compare, the run fails (exit
+status 1) when any scenario's throughput drops more than --tolerance below
+the saved baseline. Baselines are only comparable on the same machine.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+os.environ.setdefault("MODEL_PROVIDER", "fake")
+# Keep the LLM budget out of the way: this measures the app, not the quota.
+os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "100000000")
+os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "100000000000")
+
+import httpx
+
+import cache
+import main
+from model_provider import FakeModel
+from traffic import JAILBREAK_PROMPT, percentile
+
+
+async def no_redis():
+    return None
+
+
+def scenario_requests(name: str, counter: itertools.count) -> tuple[str, dict]:
+    n = next(counter)
+    user_id = f"bench_user_{n % 50}"
+    if name == "blocked":
+        return "/chat", {"prompt": JAILBREAK_PROMPT, "user_id": user_id}
+    if name == "cache_hit":
+        return "/chat", {"prompt": "What are the benefits of observability?", "user_id": user_id}
+    if name == "stream_miss":
+        return "/chat/stream", {"prompt": f"Streamed benchmark prompt {n}", "user_id": user_id}
+    return "/chat", {"prompt": f"Benchmark prompt {n}", "user_id": user_id}
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, requests: int, concurrency: int) -> dict:
+    counter = itertools.count()
+    latencies: list[float] = []
+    remaining = [requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            path, payload = scenario_requests(name, counter)
+            start = time.perf_counter()
+            response = await client.post(path, json=payload)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests_per_second": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run(args) -> dict:
+    cache.get_redis_client = no_redis
+    main.get_redis_client = no_redis
+
+    results = {}
+    async with main.lifespan(main.app):
+        main.app.state.model_router = main.create_model_router(
+            {"fake": FakeModel(latency_ms=args.model_latency, distribution="constant", chunk_delay_ms=0, seed=1)}
+        )
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post("/chat", json={"prompt": "What are the benefits of observability?", "user_id": "warmup"})
+            for name in args.scenarios:
+                await run_scenario(client, name, args.warmup, args.concurrency)
+                results[name] = await run_scenario(client, name, args.requests, args.concurrency)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        floor = baseline[name]["requests_per_second"] * (1 - tolerance)
+        if stats["requests_per_second"] < floor:
+            regressions.append(f"{name}: {stats['requests_per_second']:.0f} req/s < {floor:.0f} req/s "
+                               f"(baseline {baseline[name]['requests_per_second']:.0f})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=["blocked", "cache_hit", "miss", "stream_miss"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Fake model latency in ms")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fractional drop in req/s")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    results = asyncio.run(run(args))
+
+    print(f"{args.requests} requests per scenario, concurrency {args.concurrency}")
+    print(f"{'scenario':>12} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, stats in results.items():
+        print(f"{name:>12} {stats['requests_per_second']:>9.0f} {stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,112 @@
+"""Light-user tail latency while one heavy user saturates the model slots.
+
+Run from the repository root:
+
+    python -m benchmarks.fair_scheduling
+
+A heavy user keeps many calls queued in a closed loop. A few light users
+each send one call at a fixed interval. Light-user latency is reported
+without the heavy user, with a FIFO semaphore, and with the FairScheduler
+that gates model calls in main.py.
+
+The quota-bound runs put a RateGovernor with --rpm requests per minute
+behind --quota-concurrency slots (main.py's default), and start with its
+request bucket drained, so calls wait on the budget rather than on a slot. They compare the
+governor's per-user turns with the single FIFO queue it used to have.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from contextlib import asynccontextmanager
+
+from admission import FairScheduler
+from rate_governor import RateGovernor
+
+
+class FifoScheduler:
+    def __init__(self, concurrency: int):
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str):
+        async with self._semaphore:
+            yield
+
+
+def drained_governor(args, fifo: bool) -> RateGovernor:
+    governor = RateGovernor(
+        requests_per_minute=args.rpm,
+        tokens_per_minute=10**9,
+        max_queue=10**6,
+        max_queue_wait=3600.0,
+        max_retries=0,
+        backoff_base=0.0,
+        backoff_max=0.0,
+    )
+    governor.requests.available = 0.0
+    if fifo:
+        governor._turns = FifoScheduler(1)
+    return governor
+
+
+async def model_call(scheduler, user_id: str, latency: float, governor=None) -> float:
+    start = time.perf_counter()
+    async with scheduler.slot(user_id):
+        if governor is not None:
+            await governor.acquire(1, user_id)
+        await asyncio.sleep(latency)
+    return time.perf_counter() - start
+
+
+async def run_scenario(scheduler, args, heavy: bool, governor=None) -> list[float]:
+    deadline = time.perf_counter() + args.duration
+    light_latencies: list[float] = []
+
+    async def heavy_worker():
+        while time.perf_counter() < deadline:
+            await model_call(scheduler, "user_sg_123", args.latency, governor)
+
+    async def light_user(n: int):
+        await asyncio.sleep(args.interval * n / args.light_users)
+        while time.perf_counter() < deadline:
+            light_latencies.append(await model_call(scheduler, f"light_{n}", args.latency, governor))
+            await asyncio.sleep(args.interval)
+
+    tasks = [light_user(n) for n in range(args.light_users)]
+    if heavy:
+        tasks += [heavy_worker() for _ in range(args.heavy_concurrency)]
+    await asyncio.gather(*tasks)
+    return light_latencies
+
+
+async def run(args):
+    scenarios = [
+        ("light users only", FairScheduler(args.concurrency), False, None),
+        ("heavy user, FIFO", FifoScheduler(args.concurrency), True, None),
+        ("heavy user, fair", FairScheduler(args.concurrency), True, None),
+        ("quota, FIFO budget", FairScheduler(args.quota_concurrency), True, drained_governor(args, fifo=True)),
+        ("quota, fair budget", FairScheduler(args.quota_concurrency), True, drained_governor(args, fifo=False)),
+    ]
+
+    print(f"{args.concurrency} slots, {args.latency * 1000:.0f}ms model latency, "
+          f"heavy user with {args.heavy_concurrency} calls in flight, quota runs at {args.rpm} RPM with {args.quota_concurrency} slots")
+    print(f"{'scenario':>18} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, scheduler, heavy, governor in scenarios:
+        latencies = [latency * 1000 for latency in await run_scenario(scheduler, args, heavy, governor)]
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"{name:>18} {len(latencies):>6} {statistics.median(latencies):>8.0f} "
+              f"{quantiles[94]:>8.0f} {quantiles[98]:>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--heavy-concurrency", type=int, default=200)
+    parser.add_argument("--light-users", type=int, default=5)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rpm", type=int, default=1200, help="Request budget for the quota-bound runs")
+    parser.add_argument("--quota-concurrency", type=int, default=256)
+    asyncio.run(run(parser.parse_args()))
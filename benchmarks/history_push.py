@@ -0,0 +1,120 @@
+"""Bytes on the wire and server CPU for N open dashboards: polling vs. push.
+
+Run from the repository root:
+
+    python -m benchmarks.history_push
+
+Models a window of --window seconds in which --messages new history entries
+arrive while --dashboards browser tabs are open. Three approaches are
+compared:
+
+  * full polling: the old dashboard, GET /history (the last 50 messages) every 3s
+  * incremental polling: GET /history?cursor=<last id> every 3s
+  * push: one GET /history/stream per tab, receiving each new entry once
+
+Polling CPU is measured on a sample of requests through the ASGI app and
+scaled to the full request count. Push CPU is measured directly: every
+subscriber runs the real /history/stream generator, and the clock stops
+once all of them have received every entry. Bytes count response bodies
+plus a fixed per-response HTTP overhead.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+
+import main
+
+HTTP_OVERHEAD_BYTES = 250
+CHUNK_OVERHEAD_BYTES = 8
+
+
+def sample_entry(i: int) -> dict:
+    return {
+        "role": "assistant" if i % 2 else "user",
+        "content": "Observability lets you understand a system from its outputs. " * 3,
+        "user_id": f"user_{i % 7}",
+        "timestamp": "2026-01-01T00:00:00",
+    }
+
+
+async def measure_polling(client: httpx.AsyncClient, url_fn, sample: int) -> tuple[float, float]:
+    body_bytes = 0
+    start = time.process_time()
+    for _ in range(sample):
+        response = await client.get(url_fn())
+        body_bytes += len(response.content)
+    return (time.process_time() - start) / sample, body_bytes / sample
+
+
+async def measure_push(args) -> tuple[float, int]:
+    received = [0] * args.dashboards
+    done = asyncio.Event()
+    remaining = [args.dashboards]
+
+    async def dashboard(n: int):
+        count = 0
+        async for frame in main.history_events(cursor=None):
+            received[n] += len(frame) + CHUNK_OVERHEAD_BYTES
+            count += 1
+            if count == args.messages:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    done.set()
+                return
+
+    tasks = [asyncio.create_task(dashboard(n)) for n in range(args.dashboards)]
+    await asyncio.sleep(0.5)
+
+    start = time.process_time()
+    for i in range(args.messages):
+        main.append_history(sample_entry(i))
+        await asyncio.sleep(0)
+    await done.wait()
+    cpu = time.process_time() - start
+
+    await asyncio.gather(*tasks)
+    return cpu, sum(received) + args.dashboards * HTTP_OVERHEAD_BYTES
+
+
+async def run(args):
+    tailer = asyncio.create_task(main.history_store.tail(main.history_hub.publish))
+    for i in range(50):
+        main.append_history(sample_entry(i))
+    cursor = (await main.history_store.read(limit=1))["next_cursor"]
+
+    polls = args.dashboards * int(args.window / args.interval)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        full_cpu, full_bytes = await measure_polling(client, lambda: "/history?limit=50", args.sample)
+        incremental_cpu, incremental_bytes = await measure_polling(client, lambda: f"/history?cursor={cursor}", args.sample)
+
+    push_cpu, push_bytes = await measure_push(args)
+    tailer.cancel()
+
+    rows = [
+        ("full polling", polls, polls * (full_bytes + HTTP_OVERHEAD_BYTES), polls * full_cpu),
+        ("incremental polling", polls, polls * (incremental_bytes + HTTP_OVERHEAD_BYTES), polls * incremental_cpu),
+        ("push (SSE)", args.dashboards, push_bytes, push_cpu),
+    ]
+
+    print(f"{args.dashboards} dashboards, {args.messages} new entries over {args.window:.0f}s, "
+          f"polling every {args.interval:.0f}s")
+    print(f"{'mode':>20} {'requests':>9} {'MB on wire':>11} {'server CPU s':>13}")
+    for name, requests, total_bytes, cpu in rows:
+        print(f"{name:>20} {requests:>9} {total_bytes / 1e6:>11.2f} {cpu:>13.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dashboards", type=int, default=1000)
+    parser.add_argument("--window", type=float, default=60.0)
+    parser.add_argument("--interval", type=float, default=3.0)
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--sample", type=int, default=300, help="Polling requests actually executed")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(run(args))
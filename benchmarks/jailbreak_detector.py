@@ -0,0 +1,67 @@
+"""Per-prompt cost of the jailbreak check as the rule list grows.
+
+Run from the repository root:
+
+    python -m benchmarks.jailbreak_detector
+
+Compares the original per-keyword scan (lowercasing the prompt once per
+keyword) against the compiled JailbreakDetector on a 10k-character prompt
+that matches no rule, which is the common and most expensive case.
+"""
+import argparse
+import random
+import string
+import time
+
+from jailbreak_detector import JailbreakDetector
+
+
+def keyword_scan(prompt: str, keywords: list[str]) -> bool:
+    return any(kw.lower() in prompt.lower() for kw in keywords)
+
+
+def random_phrase(rng: random.Random) -> str:
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(rng.randint(1, 4))]
+    return " ".join(words)
+
+
+def time_per_call(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    sentences = [
+        "Explain quantum physics like I'm 5.",
+        "What are the benefits of observability?",
+        "Describe the water cycle and its importance to Earth's ecosystem.",
+    ]
+    prompt = ""
+    while len(prompt) < args.prompt_length:
+        prompt += rng.choice(sentences) + " "
+    prompt = prompt[:args.prompt_length]
+
+    print(f"prompt length: {len(prompt)} chars")
+    print(f"{'rules':>7} {'keyword scan ms':>16} {'detector ms':>12}")
+    for count in args.rules:
+        keywords = [random_phrase(rng) for _ in range(count)]
+        detector = JailbreakDetector(keywords=keywords, rules_file=None, threshold=1.0)
+        assert not detector.scan(prompt).blocked
+
+        repeat = max(3, args.budget // count)
+        naive = time_per_call(lambda: keyword_scan(prompt, keywords), repeat)
+        compiled = time_per_call(lambda: detector.scan(prompt), args.repeat)
+        print(f"{count:>7} {naive:>16.3f} {compiled:>12.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, nargs="+", default=[1, 10, 100, 1000, 5000])
+    parser.add_argument("--prompt-length", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=2000, help="Keyword scans per level, divided by rule count")
+    parser.add_argument("--seed", type=int, default=3)
+    run(parser.parse_args())
@@ -0,0 +1,61 @@
+"""Throughput of /chat against the fake model provider at increasing concurrency.
+
+Run from the repository root:
+
+    python -m benchmarks.load_concurrency
+
+Each request uses a unique prompt so every call reaches the model. Redis is
+bypassed so the numbers only reflect how many LLM calls one worker can keep
+in flight.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import cache
+import main
+from model_provider import FakeModel
+
+
+async def no_redis():
+    return None
+
+
+async def run_level(concurrency: int, num_requests: int) -> float:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with gate:
+            request = main.ChatRequest(prompt=f"benchmark prompt {concurrency}-{i}", user_id="bench_user")
+            await main.chat_endpoint(request)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(num_requests)))
+    return time.perf_counter() - start
+
+
+async def run(args):
+    main.app.state.model_router = main.create_model_router({"fake": FakeModel(latency_ms=args.latency * 1000, distribution="constant")})
+    main.app.state.llm_scheduler = main.FairScheduler(main.settings.llm_max_concurrency)
+    main.app.state.rate_governor = main.create_rate_governor()
+    cache.get_redis_client = no_redis
+    main.get_redis_client = no_redis
+
+    print(f"stub latency: {args.latency * 1000:.0f}ms, llm_max_concurrency: {main.settings.llm_max_concurrency}")
+    print(f"{'concurrency':>12} {'requests':>9} {'seconds':>9} {'req/s':>9}")
+    for concurrency in args.levels:
+        num_requests = max(args.requests, concurrency * 4)
+        elapsed = await run_level(concurrency, num_requests)
+        print(f"{concurrency:>12} {num_requests:>9} {elapsed:>9.2f} {num_requests / elapsed:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub model latency in seconds")
+    parser.add_argument("--requests", type=int, default=200, help="Minimum requests per level")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 128, 256])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(run(args))
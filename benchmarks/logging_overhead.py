@@ -0,0 +1,200 @@
+"""Log records/sec and per-request logging cost: synchronous handlers vs. the queued pipeline.
+
+Run from the repository root:
+
+    python -m benchmarks.logging_overhead
+
+Part one emits --records identical error records from one thread, the way
+the Redis error handlers do during an outage, and reports what the caller
+pays per record and how many records per second reach the output. Part two
+drives /chat in-process while every Redis connection attempt is refused
+(the circuit breaker is held closed, so each request logs its connection
+errors) and reports throughput next to a run with logging switched off.
+"log us/req" is the time spent inside Logger.handle per request, i.e. what
+logging costs the event loop directly. The listener thread still needs the
+GIL to format, so on a single core it competes with the loop for CPU.
+
+Modes:
+  sync text    the previous setup: basicConfig's handler on the caller
+  sync json    the JSON formatter as it was (new tz and datetime.now() per
+               record), still on the caller
+  queued json  log_pipeline with the repeat filter effectively disabled
+  queued json+filter  log_pipeline with the default repeat filter
+
+Output goes to a stream that only counts lines.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+os.environ.setdefault("MODEL_PROVIDER", "fake")
+os.environ["REDIS_HOST"] = "127.0.0.1"
+os.environ["REDIS_PORT"] = "1"
+os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "100000000")
+os.environ.setdefault("LLM_TOKENS_PER_MINUTE", "100000000000")
+
+import httpx
+from pythonjsonlogger.json import JsonFormatter
+
+import cache
+import main
+from circuit_breaker import CircuitBreaker
+from log_pipeline import TEXT_FORMAT, configure_logging, log_stats
+from model_provider import FakeModel
+
+MODES = ["sync text", "sync json", "queued json", "queued json+filter"]
+
+
+class LegacySingaporeJsonFormatter(JsonFormatter):
+    def add_fields(self, log_record, record, message_dict):
+        super().add_fields(log_record, record, message_dict)
+        if self.timestamp:
+            log_record['timestamp'] = datetime.now(timezone(timedelta(hours=8))).isoformat()
+
+
+class LineCounter:
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text: str):
+        self.lines += text.count("\n")
+
+    def flush(self):
+        pass
+
+
+class HandleClock:
+    """Adds up the time callers spend in Logger.handle: filters, handlers and, when synchronous, formatting and I/O."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        original = logging.Logger.handle
+
+        def timed(logger, record):
+            start = time.perf_counter()
+            try:
+                original(logger, record)
+            finally:
+                self.seconds += time.perf_counter() - start
+
+        logging.Logger.handle = timed
+
+
+class NeverOpen(CircuitBreaker):
+    def trip(self, error=None):
+        pass
+
+
+def configure(mode: str, stream: LineCounter, burst: int, queue_size: int):
+    """Installs mode's handlers on the root logger; returns the listener for queued modes."""
+    if mode.startswith("sync"):
+        handler = logging.StreamHandler(stream)
+        if mode == "sync json":
+            handler.setFormatter(LegacySingaporeJsonFormatter('%(name)s %(levelname)s %(message)s', timestamp=True))
+        else:
+            handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        logging.getLogger().handlers = [handler]
+        logging.getLogger().setLevel(logging.INFO)
+        return None
+
+    settings = SimpleNamespace(
+        log_level="INFO",
+        log_format="json",
+        log_queue_size=queue_size,
+        log_repeat_burst=burst if mode.endswith("filter") else 10**9,
+        log_repeat_window_seconds=10.0,
+    )
+    return configure_logging(settings, stream)
+
+
+def drain(listener):
+    if listener is not None:
+        listener.queue.join()
+
+
+def emit_records(args):
+    logger = logging.getLogger("cache")
+    error = "Error 111 connecting to 127.0.0.1:6379. Connect call failed ('127.0.0.1', 6379)."
+
+    print(f"{args.records} error records from one thread")
+    print(f"{'mode':>19} {'caller us/rec':>14} {'records/s out':>14} {'written':>9} {'suppressed':>11} {'dropped':>8}")
+    for mode in MODES:
+        stream = LineCounter()
+        listener = configure(mode, stream, args.burst, args.queue_size)
+        before = log_stats.snapshot()
+
+        start = time.perf_counter()
+        for _ in range(args.records):
+            logger.error("Redis error during read: %s", error)
+        caller = time.perf_counter() - start
+        drain(listener)
+        total = time.perf_counter() - start
+
+        after = log_stats.snapshot()
+        print(f"{mode:>19} {caller / args.records * 1e6:>14.2f} {stream.lines / total:>14.0f} {stream.lines:>9} "
+              f"{after['suppressed'] - before['suppressed']:>11} {after['dropped'] - before['dropped']:>8}")
+
+
+async def chat_throughput(client: httpx.AsyncClient, requests: int, concurrency: int, counter: itertools.count) -> float:
+    remaining = [requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            response = await client.post("/chat", json={"prompt": f"Logging benchmark prompt {next(counter)}", "user_id": "bench"})
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start)
+
+
+async def chat_requests(args):
+    breaker = NeverOpen("redis", probe=cache.probe_redis)
+    cache.redis_breaker = breaker
+    main.redis_breaker = breaker
+    main.user_rate_limiter = None
+    counter = itertools.count()
+
+    print(f"\n{args.requests} /chat cache misses, concurrency {args.concurrency}, every Redis connect refused")
+    print(f"{'mode':>19} {'req/s':>9} {'log us/req':>11} {'written':>9}")
+    clock = HandleClock()
+    async with main.lifespan(main.app):
+        main.app.state.model_router = main.create_model_router(
+            {"fake": FakeModel(latency_ms=0, distribution="constant", seed=1)}
+        )
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            logging.getLogger().setLevel(logging.CRITICAL)
+            await chat_throughput(client, args.warmup, args.concurrency, counter)
+            silent = await chat_throughput(client, args.requests, args.concurrency, counter)
+            print(f"{'logging off':>19} {silent:>9.0f} {'-':>11} {0:>9}")
+
+            for mode in MODES:
+                stream = LineCounter()
+                listener = configure(mode, stream, args.burst, args.queue_size)
+                clock.seconds = 0.0
+                throughput = await chat_throughput(client, args.requests, args.concurrency, counter)
+                drain(listener)
+                print(f"{mode:>19} {throughput:>9.0f} {clock.seconds / args.requests * 1e6:>11.1f} {stream.lines:>9}")
+
+            logging.getLogger().setLevel(logging.CRITICAL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--burst", type=int, default=5, help="Repeat filter burst per call site")
+    parser.add_argument("--queue-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    emit_records(args)
+    asyncio.run(chat_requests(args))
@@ -0,0 +1,138 @@
+"""Per-request cost of metrics emission: direct DogStatsD calls vs. the buffered facade.
+
+Run from the repository root:
+
+    python -m benchmarks.metrics_overhead
+
+Replays the metrics a cache-miss /chat request records (cache miss, three
+token histograms, time to first token, a governor gauge pair and wait
+histogram) plus the cache_stats updates. It runs them --requests times from
+--threads threads. "direct" is the old code path: the global statsd client
+with an env tag list built on every call and a plain dict for cache_stats.
+"buffered" goes through MetricsBuffer and Counters, including the cost of
+the flushes. Both clients send to a local UDP socket that counts the
+datagrams they produce.
+"""
+import argparse
+import socket
+import threading
+import time
+
+from datadog import initialize, statsd
+from datadog.dogstatsd import DogStatsd
+
+from metrics import Counters, MetricsBuffer
+
+
+class PacketCounter:
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+        self.packets = 0
+        self.bytes = 0
+        self._stop = False
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def _receive(self):
+        while not self._stop:
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            self.packets += 1
+            self.bytes += len(data)
+
+    def drain(self) -> tuple[int, int]:
+        time.sleep(0.5)
+        packets, size = self.packets, self.bytes
+        self.packets = self.bytes = 0
+        return packets, size
+
+
+def direct_request(env: str, stats: dict):
+    stats["misses"] += 1
+    statsd.increment('gemini_chat_api.cache.misses', tags=[f'env:{env}'])
+    statsd.gauge('gemini_chat_api.llm.governor.queue_depth', 1, tags=[f'env:{env}'])
+    statsd.gauge('gemini_chat_api.llm.governor.queue_depth', 0, tags=[f'env:{env}'])
+    statsd.histogram('gemini_chat_api.llm.governor.wait_seconds', 0.002, tags=[f'env:{env}'])
+    statsd.histogram('gemini_chat_api.llm.tokens.input', 12, tags=[f'env:{env}'])
+    statsd.histogram('gemini_chat_api.llm.tokens.output', 250, tags=[f'env:{env}'])
+    statsd.histogram('gemini_chat_api.llm.tokens.total', 262, tags=[f'env:{env}'])
+    statsd.histogram('gemini_chat_api.llm.time_to_first_token', 0.41, tags=[f'env:{env}'])
+
+
+def buffered_request(metrics: MetricsBuffer, stats: Counters):
+    stats.add("misses")
+    metrics.increment('gemini_chat_api.cache.misses')
+    metrics.gauge('gemini_chat_api.llm.governor.queue_depth', 1)
+    metrics.gauge('gemini_chat_api.llm.governor.queue_depth', 0)
+    metrics.histogram('gemini_chat_api.llm.governor.wait_seconds', 0.002)
+    metrics.histogram('gemini_chat_api.llm.tokens.input', 12)
+    metrics.histogram('gemini_chat_api.llm.tokens.output', 250)
+    metrics.histogram('gemini_chat_api.llm.tokens.total', 262)
+    metrics.histogram('gemini_chat_api.llm.time_to_first_token', 0.41)
+
+
+def run_threads(fn, requests: int, threads: int) -> float:
+    per_thread = requests // threads
+
+    def worker():
+        for _ in range(per_thread):
+            fn()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - start
+
+
+def run(args):
+    receiver = PacketCounter()
+
+    initialize(statsd_host="127.0.0.1", statsd_port=receiver.port)
+    stats = {"misses": 0}
+    direct_elapsed = run_threads(lambda: direct_request("benchmark", stats), args.requests, args.threads)
+    direct_packets, direct_bytes = receiver.drain()
+
+    client = DogStatsd(host="127.0.0.1", port=receiver.port, constant_tags=["env:benchmark"], disable_buffering=False)
+    metrics = MetricsBuffer(client=client, flush_interval=args.flush_interval, max_samples=args.max_samples)
+    counters = Counters("misses")
+    stop = threading.Event()
+
+    def flusher():
+        while not stop.wait(args.flush_interval):
+            metrics.flush()
+
+    flush_thread = threading.Thread(target=flusher)
+    flush_thread.start()
+    buffered_elapsed = run_threads(lambda: buffered_request(metrics, counters), args.requests, args.threads)
+    stop.set()
+    flush_thread.join()
+    start = time.perf_counter()
+    metrics.flush()
+    buffered_elapsed += time.perf_counter() - start
+    buffered_packets, buffered_bytes = receiver.drain()
+
+    completed = args.requests // args.threads * args.threads
+    print(f"{completed} requests across {args.threads} threads, 8 metrics and a cache_stats update each")
+    print(f"{'mode':>9} {'us/request':>11} {'datagrams':>10} {'KB sent':>9} {'lost updates':>13}")
+    print(f"{'direct':>9} {direct_elapsed / completed * 1e6:>11.2f} {direct_packets:>10} "
+          f"{direct_bytes / 1024:>9.0f} {completed - stats['misses']:>13}")
+    print(f"{'buffered':>9} {buffered_elapsed / completed * 1e6:>11.2f} {buffered_packets:>10} "
+          f"{buffered_bytes / 1024:>9.0f} {completed - counters['misses']:>13}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--flush-interval", type=float, default=2.0)
+    parser.add_argument("--max-samples", type=int, default=1000)
+    run(parser.parse_args())
@@ -0,0 +1,105 @@
+"""/chat latency while Redis is unreachable, with and without the circuit breaker.
+
+Run from the repository root:
+
+    python -m benchmarks.redis_outage
+
+Redis is replaced by a black hole: a TCP listener that accepts connections
+and never answers, the way a hung or partitioned Redis behaves. The client
+is created before the run, as if Redis stopped answering after the worker
+connected, so requests do not go through the startup connect (where only
+one caller waits and the rest skip Redis). Every Redis call then waits out
+REDIS_SOCKET_TIMEOUT_SECONDS. Without the breaker each request pays that
+for the rate limiter, cache read and cache write; with it, the first
+timeout opens the circuit and requests go straight to the model.
+
+Each mode starts from an empty local cache and fresh Redis connections, and
+sends prompts no other mode has sent.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+BLACK_HOLE_PORT = 6398
+
+os.environ.setdefault("MODEL_PROVIDER", "fake")
+os.environ["REDIS_HOST"] = "127.0.0.1"
+os.environ["REDIS_PORT"] = str(BLACK_HOLE_PORT)
+
+import httpx
+import redis.asyncio as aioredis
+
+import cache
+import main
+from circuit_breaker import CircuitBreaker
+from model_provider import FakeModel
+from traffic import percentile
+
+
+class NeverOpen(CircuitBreaker):
+    """The behaviour before the breaker: every call tries Redis again."""
+
+    def trip(self, error=None):
+        pass
+
+
+async def black_hole(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    await reader.read()
+    writer.close()
+
+
+async def run_mode(name: str, breaker: CircuitBreaker, requests: int, concurrency: int, model_latency: float) -> list[float]:
+    cache.local_cache.clear()
+    cache.reset_after_fork()
+    cache.redis_breaker = breaker
+    main.redis_breaker = breaker
+    # Connected before the outage: no ping, so nothing has failed yet.
+    cache.redis_client = aioredis.Redis(connection_pool=cache.get_redis_pool())
+    latencies: list[float] = []
+    remaining = [requests]
+
+    async with main.lifespan(main.app):
+        main.app.state.model_router = main.create_model_router(
+            {"fake": FakeModel(latency_ms=model_latency, distribution="constant")}
+        )
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            async def worker(n: int):
+                while remaining[0] > 0:
+                    remaining[0] -= 1
+                    start = time.perf_counter()
+                    response = await client.post("/chat", json={"prompt": f"{name} outage prompt {remaining[0]}", "user_id": f"user_{n}"})
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(worker(n) for n in range(concurrency)))
+
+    return sorted(latencies)
+
+
+async def run(args):
+    server = await asyncio.start_server(black_hole, "127.0.0.1", BLACK_HOLE_PORT)
+    async with server:
+        modes = {
+            "breaker": CircuitBreaker("redis", probe=cache.probe_redis, reset_timeout=60),
+            "no breaker": NeverOpen("redis", probe=cache.probe_redis),
+        }
+        print(f"{args.requests} requests, concurrency {args.concurrency}, model latency {args.model_latency:.0f}ms")
+        print(f"{'mode':>12} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, breaker in modes.items():
+            latencies = await run_mode(name, breaker, args.requests, args.concurrency, args.model_latency)
+            print(f"{name:>12} {percentile(latencies, 50) * 1000:>9.1f} {percentile(latencies, 99) * 1000:>9.1f} "
+                  f"{latencies[-1] * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model-latency", type=float, default=50.0, help="Fake model latency in ms")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    asyncio.run(run(args))
@@ -0,0 +1,148 @@
+"""Hit-rate gain and lookup latency of prompt normalization and the semantic index.
+
+Run from the repository root:
+
+    python -m benchmarks.semantic_cache
+
+A synthetic request stream draws base prompts with a Zipf-like skew and
+renders each one with random surface variations (case, spacing,
+punctuation, filler words). The same stream is replayed against exact keys,
+whitespace-only keys (the default), fully normalized keys (whitespace, case
+and punctuation) and those plus the semantic index. Wrong hits are
+semantic matches that resolved to a different base prompt.
+"""
+import argparse
+import hashlib
+import random
+import statistics
+import time
+
+from prompt_normalizer import build_normalizer
+from semantic_cache import SemanticIndex
+
+TEMPLATES = [
+    "Explain {topic} like I'm 5.",
+    "What are the benefits of {topic}?",
+    "Write a haiku about {topic}.",
+    "How does {topic} work?",
+    "Describe the history of {topic} in simple terms.",
+    "What are the main criticisms of {topic}?",
+]
+
+SUBJECTS = [
+    "quantum", "observability", "python", "blockchain", "photosynthesis", "kubernetes",
+    "mediterranean", "volcanic", "medieval", "monetary", "neural", "orbital", "coral",
+    "renaissance", "distributed", "solar", "genetic", "urban", "maritime", "arctic",
+]
+
+OBJECTS = [
+    "physics", "tracing", "typing", "ledgers", "cycles", "scheduling", "diets", "islands",
+    "castles", "policy", "networks", "mechanics", "reefs", "painting", "consensus",
+    "storms", "editing", "planning", "trade", "ecosystems",
+]
+
+FILLERS = ["please", "briefly", "now", "for me"]
+
+
+def make_prompt(rng: random.Random) -> str:
+    topic = f"{rng.choice(SUBJECTS)} {rng.choice(OBJECTS)}"
+    return rng.choice(TEMPLATES).format(topic=topic)
+
+
+def vary(prompt: str, rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.3:
+        return prompt
+    if roll < 0.5:
+        return prompt.lower()
+    if roll < 0.65:
+        return "  " + prompt.replace(" ", "  ") + " "
+    if roll < 0.8:
+        return prompt.rstrip(".?!")
+    return f"{prompt.rstrip('.?!')} {rng.choice(FILLERS)}."
+
+
+def exact_key(prompt: str) -> str:
+    return hashlib.md5(prompt.encode('utf-8')).hexdigest()
+
+
+def replay(stream, normalize, index) -> dict:
+    seen: dict[str, str] = {}
+    hits = wrong = 0
+
+    for base, prompt in stream:
+        normalized = normalize(prompt)
+        key = exact_key(normalized)
+
+        if key in seen:
+            hits += 1
+            continue
+
+        if index is not None:
+            match = index.lookup(normalized)
+            if match is not None:
+                hits += 1
+                wrong += seen[match[0]] != base
+                continue
+            index.add(normalized, key)
+
+        seen[key] = base
+
+    return {"hit_rate": hits / len(stream), "wrong": wrong}
+
+
+def hit_rate_report(args, rng: random.Random):
+    bases = list({make_prompt(rng) for _ in range(args.distinct * 3)})[:args.distinct]
+    weights = [1 / (rank + 1) for rank in range(len(bases))]
+    stream = [(base, vary(base, rng)) for base in rng.choices(bases, weights=weights, k=args.requests)]
+
+    normalize = build_normalizer(["whitespace", "case", "punctuation"])
+    strategies = [
+        ("exact", lambda prompt: prompt, None),
+        ("whitespace (default)", build_normalizer(["whitespace"]), None),
+        ("normalized", normalize, None),
+        ("normalized+semantic", normalize, SemanticIndex(args.requests, args.dimensions, args.threshold)),
+    ]
+
+    print(f"{args.requests} requests over {len(bases)} base prompts (threshold {args.threshold})")
+    print(f"{'strategy':>22} {'hit rate':>9} {'wrong hits':>11}")
+    for name, normalizer, index in strategies:
+        result = replay(stream, normalizer, index)
+        print(f"{name:>22} {result['hit_rate'] * 100:>8.1f}% {result['wrong']:>11}")
+
+
+def latency_report(args, rng: random.Random):
+    normalize = build_normalizer(["whitespace", "case", "punctuation"])
+    queries = [normalize(vary(make_prompt(rng), rng)) for _ in range(args.queries)]
+
+    print()
+    print(f"{'index size':>11} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in args.sizes:
+        index = SemanticIndex(size, args.dimensions, args.threshold)
+        for i in range(size):
+            index.add(normalize(f"{make_prompt(rng)} {i}"), str(i))
+
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            index.lookup(query)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        p99 = statistics.quantiles(timings, n=100)[98]
+        print(f"{size:>11} {statistics.median(timings):>8.3f} {p99:>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hit_rate_report(args, rng)
+    latency_report(args, rng)
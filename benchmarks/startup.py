@@ -0,0 +1,129 @@
+"""Cold start: import time, time to live and ready, and time to the first successful /chat.
+
+Run from the repository root:
+
+    python -m benchmarks.startup
+
+Import time is measured in fresh interpreters: `import main`, then
+google.generativeai, which main used to import at the top and which is now
+only imported when the gemini client is built.
+
+Then, for each provider, Redis behaviour and startup mode, a uvicorn worker
+is started and polled from the moment the process is spawned: /health/live,
+/health/ready and, with the fake model, the first 200 from POST /chat (the
+gemini runs use a dummy key, so they stop at ready). Redis is either a
+closed port (connections refused at once) or a black hole that accepts
+connections and never answers, like a Redis that is still booting or
+unreachable behind a firewall, so a connect waits out the 5s timeout.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Optional
+
+import httpx
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import main
+middle = time.perf_counter()
+import google.generativeai
+print(middle - start, time.perf_counter() - middle)
+"""
+
+
+def base_env(mode: str, provider: str, redis_port: int) -> dict:
+    return {
+        **os.environ,
+        "STARTUP_MODE": mode,
+        "MODEL_PROVIDER": provider,
+        "GEMINI_API_KEY": "benchmark-key",
+        "FAKE_MODEL_LATENCY_MS": "0",
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(redis_port),
+        "CACHE_REFRESH_ENABLED": "false",
+        "DD_TRACE_ENABLED": "false",
+    }
+
+
+def import_seconds(runs: int) -> tuple[float, float]:
+    times = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT],
+            env=base_env("background", "gemini", 1),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        main_seconds, genai_seconds = output.strip().splitlines()[-1].split()
+        times.append((float(main_seconds), float(genai_seconds)))
+    return min(times)
+
+
+def wait_for(request, deadline: float) -> float:
+    while time.monotonic() < deadline:
+        try:
+            if request().status_code == 200:
+                return time.monotonic()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError("Server did not answer in time")
+
+
+def cold_start(provider: str, mode: str, redis_port: int, port: int) -> tuple[float, Optional[float], float]:
+    base_url = f"http://127.0.0.1:{port}"
+    client = httpx.Client(base_url=base_url, timeout=30)
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=base_env(mode, provider, redis_port),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + 60
+        live = wait_for(lambda: client.get("/health/live"), deadline)
+        first_chat = None
+        if provider == "fake":
+            first_chat = wait_for(lambda: client.post("/chat", json={"prompt": "Cold start?", "user_id": "bench"}), deadline)
+        ready = wait_for(lambda: client.get("/health/ready"), deadline)
+    finally:
+        server.terminate()
+        server.wait()
+        client.close()
+    return live - started, first_chat and first_chat - started, ready - started
+
+
+def black_hole() -> socket.socket:
+    # Listening but never accepting: the kernel completes the handshake, and nothing ever replies.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(1024)
+    return sock
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["eager", "background"])
+    parser.add_argument("--import-runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    main_seconds, genai_seconds = import_seconds(args.import_runs)
+    print(f"import main: {main_seconds:.2f}s, then google.generativeai: {genai_seconds:.2f}s (best of {args.import_runs})")
+
+    hung = black_hole()
+    print(f"\n{'provider':>9} {'redis':>8} {'mode':>11} {'live s':>7} {'first chat s':>13} {'ready s':>8}")
+    for provider in ("fake", "gemini"):
+        for redis_name, redis_port in (("refused", 1), ("hung", hung.getsockname()[1])):
+            for mode in args.modes:
+                live, first_chat, ready = cold_start(provider, mode, redis_port, args.port)
+                first_chat = f"{first_chat:.2f}" if first_chat is not None else "-"
+                print(f"{provider:>9} {redis_name:>8} {mode:>11} {live:>7.2f} {first_chat:>13} {ready:>8.2f}")
+    hung.close()
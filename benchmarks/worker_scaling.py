@@ -0,0 +1,110 @@
+"""Throughput of /chat across 1, 2, 4 and 8 uvicorn workers with the fake model.
+
+Run from the repository root:
+
+    python -m benchmarks.worker_scaling
+
+For each worker count this starts `uvicorn main:app --workers N` with the
+fake model provider, waits for /health, and drives it over real HTTP from
+--clients load-generator processes, each running traffic.run_load in
+closed-loop mode with the default scenario mix. Redis is pointed at a closed
+port, so the circuit breaker keeps it out of the request path and every
+worker serves from its own L1 cache.
+
+Throughput can only scale while workers have CPUs to themselves, and the
+load generators share the same machine, so run this on a host with more
+cores than the largest worker count.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from traffic import run_load
+
+
+def server_env(workers: int, model_latency: float) -> dict:
+    return {
+        **os.environ,
+        "MODEL_PROVIDER": "fake",
+        "FAKE_MODEL_LATENCY_MS": str(model_latency),
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": "1",
+        "USER_RATE_LIMIT_ENABLED": "false",
+        "CACHE_REFRESH_ENABLED": "false",
+        "LLM_REQUESTS_PER_MINUTE": "100000000",
+        "LLM_TOKENS_PER_MINUTE": "100000000000",
+        "WEB_CONCURRENCY": str(workers),
+        "DD_TRACE_ENABLED": "false",
+    }
+
+
+def wait_until_ready(base_url: str, workers: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    seen = set()
+    while time.monotonic() < deadline:
+        try:
+            seen.add(httpx.get(f"{base_url}/health", timeout=2).json()["worker"])
+        except (httpx.HTTPError, KeyError, ValueError):
+            time.sleep(0.5)
+            continue
+        # Workers accept on a shared socket, so keep asking until each has answered once.
+        if len(seen) >= workers:
+            return
+    raise RuntimeError(f"Only {len(seen)} of {workers} workers became ready")
+
+
+def client_process(base_url: str, concurrency: int, duration: float, seed: int) -> tuple[int, int]:
+    summary = asyncio.run(run_load(base_url=base_url, mode="closed", concurrency=concurrency, duration=duration, seed=seed))
+    return summary["requests"], summary["outcomes"]["error"]["count"]
+
+
+def measure(workers: int, args) -> tuple[float, int]:
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--workers", str(workers), "--log-level", "warning"],
+        env=server_env(workers, args.model_latency),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(base_url, workers)
+        client_process(base_url, args.concurrency, args.warmup, seed=0)
+
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.starmap(
+                client_process,
+                [(base_url, args.concurrency, args.duration, seed) for seed in range(1, args.clients + 1)]
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+    requests = sum(count for count, _ in results)
+    errors = sum(failed for _, failed in results)
+    return requests / args.duration, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, default=4, help="Load-generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="Connections per load generator")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--model-latency", type=float, default=50.0, help="Fake model latency in ms")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"CPUs: {os.cpu_count()}, {args.clients} load generators x {args.concurrency} connections, {args.duration:.0f}s per run")
+    print(f"{'workers':>8} {'req/s':>9} {'speedup':>8} {'errors':>7}")
+    baseline = None
+    for workers in args.workers:
+        throughput, errors = measure(workers, args)
+        baseline = baseline or throughput
+        print(f"{workers:>8} {throughput:>9.0f} {throughput / baseline:>7.2f}x {errors:>7}")
@@ -0,0 +1,650 @@
+import asyncio
+import hashlib
+import logging
+import os
+import zlib
+from typing import TYPE_CHECKING, Optional, Union
+
+import redis
+import redis.asyncio as aioredis
+from redis.client import NEVER_DECODE
+
+from cache_analytics import KeyAnalytics
+from cache_envelope import decode_entry, encode_entry
+from cache_refresher import HotKeyTracker
+from circuit_breaker import CircuitBreaker
+from config import get_settings
+from local_cache import LocalCache
+from metrics import Counters, metrics
+from prompt_normalizer import build_normalizer
+
+if TYPE_CHECKING:
+    from semantic_cache import SemanticIndex
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+ROUTED_MODEL = "auto"
+
+# Blocking XREADs for the history tail wait server-side; their connections get this much on top of the socket timeout.
+REDIS_TAIL_BLOCK_MS = 2000
+
+redis_pool: Optional[aioredis.BlockingConnectionPool] = None
+redis_tail_pool: Optional[aioredis.BlockingConnectionPool] = None
+redis_client: Optional[aioredis.Redis] = None
+redis_connecting: Optional[asyncio.Task] = None
+cache_stats = Counters(
+    "hits", "misses", "errors", "l1_hits", "l2_hits", "semantic_hits", "stale_hits", "response_bytes", "stored_bytes"
+)
+local_cache = LocalCache(
+    max_entries=settings.local_cache_max_entries,
+    max_bytes=settings.local_cache_max_bytes
+)
+normalize_prompt = build_normalizer(settings.prompt_normalization)
+hot_keys = HotKeyTracker(max_keys=settings.cache_refresh_tracked_keys)
+key_analytics = KeyAnalytics(
+    width=settings.cache_analytics_sketch_width,
+    depth=settings.cache_analytics_sketch_depth,
+    top_keys=settings.cache_analytics_top_keys,
+    access_log_size=settings.cache_analytics_access_log_size,
+    size_sample_rate=settings.cache_analytics_size_sample_rate,
+    size_samples=settings.cache_analytics_size_samples
+)
+# Entries outlive their freshness by cache_stale_seconds so they can be served while being refreshed.
+storage_ttl_seconds = settings.cache_ttl_seconds + settings.cache_stale_seconds
+semantic_index: Optional["SemanticIndex"] = None
+if settings.semantic_cache_enabled:
+    # Only imported when enabled: it pulls in numpy, which is slow to import.
+    from semantic_cache import SemanticIndex as SemanticIndexImpl
+
+    semantic_index = SemanticIndexImpl(
+        max_entries=settings.semantic_cache_max_entries,
+        dimensions=settings.semantic_cache_dimensions,
+        threshold=settings.semantic_cache_threshold
+    )
+
+
+def create_redis_pool(max_connections: int, socket_timeout: float) -> aioredis.BlockingConnectionPool:
+    pool_options = {
+        "max_connections": max_connections,
+        "timeout": settings.redis_pool_timeout_seconds,
+        "decode_responses": True,
+        "socket_connect_timeout": settings.redis_connect_timeout_seconds,
+        "socket_timeout": socket_timeout,
+        # A retry after a timeout doubles the wait when Redis hangs; failing lets the breaker open instead.
+        "retry_on_timeout": False,
+        "health_check_interval": 30
+    }
+    redis_url = os.getenv('REDIS_URL')
+    if redis_url:
+        return aioredis.BlockingConnectionPool.from_url(redis_url, **pool_options)
+    return aioredis.BlockingConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        db=settings.redis_db,
+        **pool_options
+    )
+
+
+def get_redis_pool() -> aioredis.BlockingConnectionPool:
+    global redis_pool
+
+    if redis_pool is None:
+        redis_pool = create_redis_pool(settings.redis_max_connections, settings.redis_socket_timeout_seconds)
+
+    return redis_pool
+
+
+def get_redis_tail_pool() -> aioredis.BlockingConnectionPool:
+    global redis_tail_pool
+
+    if redis_tail_pool is None:
+        redis_tail_pool = create_redis_pool(2, settings.redis_socket_timeout_seconds + REDIS_TAIL_BLOCK_MS / 1000)
+
+    return redis_tail_pool
+
+
+async def probe_redis():
+    global redis_client
+
+    client = redis_client or aioredis.Redis(connection_pool=get_redis_pool())
+    await client.ping()
+    if redis_client is None:
+        logger.info(f"Redis connected: {settings.redis_host}:{settings.redis_port} (pool size: {settings.redis_max_connections})")
+    redis_client = client
+
+
+redis_breaker = CircuitBreaker(
+    "redis",
+    probe=probe_redis,
+    failure_threshold=settings.redis_breaker_failure_threshold,
+    failure_window=settings.redis_breaker_failure_window_seconds,
+    reset_timeout=settings.redis_breaker_reset_seconds,
+    max_reset_timeout=settings.redis_breaker_max_reset_seconds
+)
+
+
+def reset_after_fork():
+    # Each worker opens its own Redis connections and counts its own cache traffic.
+    global redis_pool, redis_tail_pool, redis_client, redis_connecting
+
+    redis_pool = None
+    redis_tail_pool = None
+    redis_client = None
+    redis_connecting = None
+    redis_breaker.reset(cancel=False)
+    cache_stats.reset()
+    key_analytics.reset()
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+def report_redis_failure(e: Exception):
+    # Only connection-level errors say Redis is down; a bad command does not. A timeout has already
+    # cost its caller the full deadline, so it opens the circuit at once rather than after several.
+    if isinstance(e, redis.TimeoutError):
+        redis_breaker.trip(e)
+    elif isinstance(e, redis.ConnectionError):
+        redis_breaker.record_failure(e)
+
+
+async def connect_redis() -> Optional[aioredis.Redis]:
+    global redis_client
+
+    try:
+        client = aioredis.Redis(connection_pool=get_redis_pool())
+        await client.ping()
+        redis_client = client
+        logger.info(f"Redis connected: {settings.redis_host}:{settings.redis_port} (pool size: {settings.redis_max_connections})")
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        metrics.increment('gemini_chat_api.redis.connection_error')
+        logger.error(f"Redis connection failed: {e}")
+        redis_client = None
+        redis_breaker.trip(e)
+    except Exception as e:
+        metrics.increment('gemini_chat_api.redis.error')
+        logger.error(f"Unexpected Redis error: {e}")
+        redis_client = None
+        redis_breaker.trip(e)
+
+    return redis_client
+
+
+async def get_redis_client() -> Optional[aioredis.Redis]:
+    global redis_connecting
+
+    # While the circuit is open, skip Redis at once; the breaker reconnects in the background.
+    if not redis_breaker.allow():
+        return None
+
+    if redis_client is not None:
+        return redis_client
+
+    # One connect at a time, awaited by whoever started it. Other callers go without Redis rather
+    # than queue behind a connect that may take the full socket timeout.
+    if redis_connecting is not None and not redis_connecting.done():
+        return None
+    redis_connecting = asyncio.create_task(connect_redis())
+    return await asyncio.shield(redis_connecting)
+
+
+async def get_redis_tail_client() -> Optional[aioredis.Redis]:
+    """A client for blocking reads, on its own pool with a socket timeout that outlasts the block."""
+    if await get_redis_client() is None:
+        return None
+    return aioredis.Redis(connection_pool=get_redis_tail_pool())
+
+
+async def wait_for_redis_connect():
+    """Waits for a connect already in progress, e.g. one another task started during startup."""
+    if redis_connecting is not None and not redis_connecting.done():
+        await asyncio.shield(redis_connecting)
+
+
+async def close_redis_client():
+    global redis_client, redis_pool, redis_tail_pool
+
+    if redis_connecting is not None:
+        redis_connecting.cancel()
+
+    if redis_client:
+        try:
+            await redis_client.aclose()
+            logger.info("Redis connection closed")
+        except Exception as e:
+            logger.error(f"Error closing Redis connection: {e}")
+
+    if redis_pool:
+        await redis_pool.disconnect()
+    if redis_tail_pool:
+        await redis_tail_pool.disconnect()
+
+    redis_breaker.reset()
+
+    redis_client = None
+    redis_pool = None
+    redis_tail_pool = None
+
+
+def get_cache_key(prompt: str, model: Optional[str] = None) -> str:
+    # Pinned-model and routed responses live in separate namespaces so one never answers for the other.
+    prompt_hash = hashlib.md5(normalize_prompt(prompt).encode('utf-8')).hexdigest()
+    return f"gemini:response:{model or ROUTED_MODEL}:{prompt_hash}"
+
+
+def encode_response(response: str, metadata: Optional[dict] = None) -> bytes:
+    encoded = encode_entry(
+        response,
+        metadata,
+        threshold=settings.cache_compression_threshold_bytes,
+        level=settings.cache_compression_level
+    )
+    cache_stats.add("response_bytes", len(response.encode('utf-8')))
+    cache_stats.add("stored_bytes", len(encoded))
+    return encoded
+
+
+def decode_response(raw: Union[bytes, str, None]) -> Optional[str]:
+    try:
+        entry = decode_entry(raw)
+    except (ValueError, zlib.error, UnicodeDecodeError) as e:
+        cache_stats.add("errors")
+        logger.error("Unreadable cache entry: %s", e)
+        return None
+    return entry.text if entry and entry.text else None
+
+
+def is_stale(ttl_ms: int) -> bool:
+    return 0 <= ttl_ms <= settings.cache_stale_seconds * 1000
+
+
+def local_ttl_for(ttl_ms: int) -> float:
+    # L1 copies expire with the entry's freshness, so stale reads reach Redis and get refreshed.
+    ttl_seconds = ttl_ms / 1000 - settings.cache_stale_seconds if ttl_ms > 0 else settings.cache_ttl_seconds
+    return min(ttl_seconds, settings.local_cache_ttl_seconds)
+
+
+def get_raw(client, key: str):
+    # Envelopes are binary, so bypass the connection's UTF-8 decoding for this read.
+    return client.execute_command("GET", key, **{NEVER_DECODE: True})
+
+
+async def get_similar_response(client: aioredis.Redis, prompt: str, cache_key: str) -> Optional[str]:
+    match = semantic_index.lookup(normalize_prompt(prompt))
+    if match is None or match[0] == cache_key:
+        return None
+
+    similar_key, score = match
+    if similar_key.rsplit(":", 1)[0] != cache_key.rsplit(":", 1)[0]:
+        return None
+
+    cached = local_cache.get(similar_key)
+    if cached is None:
+        cached = decode_response(await get_raw(client, similar_key))
+    if cached:
+        logger.debug("Semantic cache hit: %.20s... -> %.20s... (score: %.3f)", cache_key, similar_key, score)
+    return cached
+
+
+async def get_cached_response(prompt: str, model: Optional[str] = None) -> Optional[str]:
+    cache_key = get_cache_key(prompt, model)
+    key_analytics.record_access(cache_key, prompt)
+
+    cached = local_cache.get(cache_key)
+    if cached is not None:
+        cache_stats.add("hits")
+        cache_stats.add("l1_hits")
+        metrics.increment('gemini_chat_api.cache.hits', tags=('cache.tier:l1',))
+        hot_keys.record(cache_key, prompt, model)
+        return cached
+
+    client = await get_redis_client()
+    if client is None:
+        cache_stats.add("errors")
+        return None
+
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            get_raw(pipe, cache_key)
+            raw, ttl_ms = await pipe.pttl(cache_key).execute()
+        cached = decode_response(raw)
+
+        if cached:
+            cache_stats.add("hits")
+            cache_stats.add("l2_hits")
+            metrics.increment('gemini_chat_api.cache.hits', tags=('cache.tier:l2',))
+            logger.debug("Cache hit: %.20s...", cache_key)
+            if is_stale(ttl_ms):
+                cache_stats.add("stale_hits")
+            hot_keys.record(cache_key, prompt, model, stale=is_stale(ttl_ms))
+            local_cache.set(cache_key, cached, local_ttl_for(ttl_ms))
+            return cached
+
+        if semantic_index is not None:
+            cached = await get_similar_response(client, prompt, cache_key)
+            if cached:
+                cache_stats.add("hits")
+                cache_stats.add("semantic_hits")
+                metrics.increment('gemini_chat_api.cache.hits', tags=('cache.tier:semantic',))
+                return cached
+
+        cache_stats.add("misses")
+        metrics.increment('gemini_chat_api.cache.misses')
+        logger.debug("Cache miss: %.20s...", cache_key)
+        return None
+
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        cache_stats.add("errors")
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Cache read error: %s", e)
+        return None
+    except redis.RedisError as e:
+        cache_stats.add("errors")
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error during read: %s", e)
+        return None
+
+
+async def cache_response(prompt: str, response: str, metadata: Optional[dict] = None, model: Optional[str] = None) -> bool:
+    cache_key = get_cache_key(prompt, model)
+    local_cache.set(cache_key, response, min(settings.cache_ttl_seconds, settings.local_cache_ttl_seconds))
+
+    client = await get_redis_client()
+    if client is None:
+        cache_stats.add("errors")
+        return False
+
+    try:
+        value = encode_response(response, metadata)
+        key_analytics.record_size(cache_key, len(value))
+        await client.setex(cache_key, storage_ttl_seconds, value)
+        if semantic_index is not None:
+            semantic_index.add(normalize_prompt(prompt), cache_key)
+        logger.debug("Cached response: %.20s... (TTL: %ss)", cache_key, settings.cache_ttl_seconds)
+        return True
+
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        cache_stats.add("errors")
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Cache write error: %s", e)
+        return False
+    except redis.RedisError as e:
+        cache_stats.add("errors")
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error during write: %s", e)
+        return False
+
+
+async def get_cached_responses(prompts: list[str], models: Optional[list[Optional[str]]] = None) -> list[Optional[str]]:
+    models = models or [None] * len(prompts)
+    cache_keys = [get_cache_key(prompt, model) for prompt, model in zip(prompts, models)]
+    results: list[Optional[str]] = [local_cache.get(cache_key) for cache_key in cache_keys]
+
+    l1_hits = 0
+    for prompt, model, cache_key, cached in zip(prompts, models, cache_keys, results):
+        key_analytics.record_access(cache_key, prompt)
+        if cached is not None:
+            l1_hits += 1
+            hot_keys.record(cache_key, prompt, model)
+    if l1_hits:
+        cache_stats.add("hits", l1_hits)
+        cache_stats.add("l1_hits", l1_hits)
+        metrics.increment('gemini_chat_api.cache.hits', l1_hits, tags=('cache.tier:l1',))
+
+    pending = [i for i, cached in enumerate(results) if cached is None]
+    if not pending:
+        return results
+
+    client = await get_redis_client()
+    if client is None:
+        cache_stats.add("errors", len(pending))
+        return results
+
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.execute_command("MGET", *[cache_keys[i] for i in pending], **{NEVER_DECODE: True})
+            for i in pending:
+                pipe.pttl(cache_keys[i])
+            values, *ttls_ms = await pipe.execute()
+    except redis.RedisError as e:
+        cache_stats.add("errors", len(pending))
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error during batch read: %s", e)
+        return results
+
+    l2_hits = 0
+    for i, raw, ttl_ms in zip(pending, values, ttls_ms):
+        cached = decode_response(raw)
+        if cached:
+            results[i] = cached
+            l2_hits += 1
+            if is_stale(ttl_ms):
+                cache_stats.add("stale_hits")
+            hot_keys.record(cache_keys[i], prompts[i], models[i], stale=is_stale(ttl_ms))
+            local_cache.set(cache_keys[i], cached, local_ttl_for(ttl_ms))
+
+    misses = len(pending) - l2_hits
+    cache_stats.add("hits", l2_hits)
+    cache_stats.add("l2_hits", l2_hits)
+    cache_stats.add("misses", misses)
+    if l2_hits:
+        metrics.increment('gemini_chat_api.cache.hits', l2_hits, tags=('cache.tier:l2',))
+    if misses:
+        metrics.increment('gemini_chat_api.cache.misses', misses)
+
+    return results
+
+
+async def cache_responses(items: list[tuple[str, str, Optional[dict], Optional[str]]]) -> bool:
+    if not items:
+        return True
+
+    local_ttl = min(settings.cache_ttl_seconds, settings.local_cache_ttl_seconds)
+    for prompt, response, _, model in items:
+        local_cache.set(get_cache_key(prompt, model), response, local_ttl)
+
+    client = await get_redis_client()
+    if client is None:
+        cache_stats.add("errors")
+        return False
+
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for prompt, response, metadata, model in items:
+                cache_key = get_cache_key(prompt, model)
+                value = encode_response(response, metadata)
+                key_analytics.record_size(cache_key, len(value))
+                pipe.setex(cache_key, storage_ttl_seconds, value)
+            await pipe.execute()
+    except redis.RedisError as e:
+        cache_stats.add("errors")
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error during batch write: %s", e)
+        return False
+
+    if semantic_index is not None:
+        for prompt, _, _, model in items:
+            semantic_index.add(normalize_prompt(prompt), get_cache_key(prompt, model))
+    logger.debug("Cached %s responses (TTL: %ss)", len(items), settings.cache_ttl_seconds)
+    return True
+
+
+async def get_ttls(cache_keys: list[str]) -> list[Optional[float]]:
+    client = await get_redis_client()
+    if client is None or not cache_keys:
+        return [None] * len(cache_keys)
+
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for cache_key in cache_keys:
+                pipe.pttl(cache_key)
+            ttls_ms = await pipe.execute()
+    except redis.RedisError as e:
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error reading cache TTLs: %s", e)
+        return [None] * len(cache_keys)
+
+    return [ttl_ms / 1000 if ttl_ms >= 0 else None for ttl_ms in ttls_ms]
+
+
+async def find_uncached(prompts: list[str]) -> list[str]:
+    client = await get_redis_client()
+    if client is None:
+        return [prompt for prompt in prompts if local_cache.get(get_cache_key(prompt)) is None]
+
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for prompt in prompts:
+                pipe.exists(get_cache_key(prompt))
+            exists = await pipe.execute()
+    except redis.RedisError as e:
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error checking cached prompts: %s", e)
+        return list(prompts)
+
+    return [prompt for prompt, found in zip(prompts, exists) if not found]
+
+
+async def acquire_generation_lock(prompt: str, model: Optional[str] = None) -> Optional[aioredis.lock.Lock]:
+    client = await get_redis_client()
+    if client is None:
+        return None
+
+    lock = client.lock(
+        f"{get_cache_key(prompt, model)}:lock",
+        timeout=settings.llm_timeout_seconds,
+        blocking=False
+    )
+    try:
+        if await lock.acquire():
+            return lock
+    except redis.RedisError as e:
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error acquiring generation lock: %s", e)
+
+    return None
+
+
+async def release_generation_lock(lock: aioredis.lock.Lock):
+    try:
+        await lock.release()
+    except redis.exceptions.LockError:
+        logger.debug("Generation lock expired before release: %s", lock.name)
+    except redis.RedisError as e:
+        logger.error("Redis error releasing generation lock: %s", e)
+
+
+async def claim_once(name: str, ttl_seconds: int) -> bool:
+    """True for the first process to claim name within ttl_seconds, and always when Redis is unavailable."""
+    client = await get_redis_client()
+    if client is None:
+        return True
+
+    try:
+        return bool(await client.set(f"gemini:claim:{name}", os.getpid(), nx=True, ex=ttl_seconds))
+    except redis.RedisError as e:
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error claiming %s: %s", name, e)
+        return True
+
+
+async def wait_for_cached_response(prompt: str, model: Optional[str] = None, poll_interval: float = 0.1) -> Optional[str]:
+    client = await get_redis_client()
+    if client is None:
+        return None
+
+    cache_key = get_cache_key(prompt, model)
+    lock_key = f"{cache_key}:lock"
+    deadline = asyncio.get_running_loop().time() + settings.llm_timeout_seconds
+
+    try:
+        while asyncio.get_running_loop().time() < deadline:
+            cached = decode_response(await get_raw(client, cache_key))
+            if cached:
+                return cached
+            if not await client.exists(lock_key):
+                return decode_response(await get_raw(client, cache_key))
+            await asyncio.sleep(poll_interval)
+    except redis.RedisError as e:
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error while waiting for coalesced response: %s", e)
+
+    return None
+
+
+async def get_memory_report(cache_keys: list[str]) -> Optional[dict]:
+    """Redis memory figures plus MEMORY USAGE for each of cache_keys (None for missing keys)."""
+    client = await get_redis_client()
+    if client is None:
+        return None
+
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.info("memory")
+            pipe.dbsize()
+            for cache_key in cache_keys:
+                pipe.memory_usage(cache_key)
+            # Managed Redis services may refuse INFO or MEMORY; report whatever did succeed.
+            info, keys, *usage = await pipe.execute(raise_on_error=False)
+    except redis.RedisError as e:
+        metrics.increment('gemini_chat_api.redis.error')
+        report_redis_failure(e)
+        logger.error("Redis error reading memory usage: %s", e)
+        return None
+
+    info = info if isinstance(info, dict) else {}
+    return {
+        "used_memory": info.get("used_memory"),
+        "maxmemory": info.get("maxmemory"),
+        "maxmemory_policy": info.get("maxmemory_policy"),
+        "keys": keys if isinstance(keys, int) else None,
+        "key_bytes": {key: size for key, size in zip(cache_keys, usage) if not isinstance(size, Exception)}
+    }
+
+
+def get_cache_stats() -> dict:
+    stats = cache_stats.snapshot()
+    total = stats["hits"] + stats["misses"]
+    hit_rate = (stats["hits"] / total * 100) if total > 0 else 0
+
+    return {
+        "hits": stats["hits"],
+        "misses": stats["misses"],
+        "errors": stats["errors"],
+        "hit_rate_percent": round(hit_rate, 2),
+        "total_requests": total,
+        "tiers": {
+            "l1": {
+                "hits": stats["l1_hits"],
+                "misses": total - stats["l1_hits"],
+                "entries": len(local_cache),
+                "bytes": local_cache.size_bytes
+            },
+            "l2": {
+                "hits": stats["l2_hits"],
+                "stale_hits": stats["stale_hits"],
+                "misses": stats["misses"] + stats["semantic_hits"],
+                "response_bytes_written": stats["response_bytes"],
+                "stored_bytes_written": stats["stored_bytes"],
+                "compression_ratio": round(stats["response_bytes"] / stats["stored_bytes"], 2) if stats["stored_bytes"] else None
+            },
+            "semantic": {
+                "enabled": semantic_index is not None,
+                "hits": stats["semantic_hits"],
+                "entries": len(semantic_index) if semantic_index is not None else 0
+            }
+        }
+    }
@@ -0,0 +1,316 @@
+import heapq
+import random
+import time
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+# dictEntry, robj and SDS headers plus the key itself, as in benchmarks/cache_capacity.py
+REDIS_KEY_OVERHEAD_BYTES = 72 + 48
+
+MEMORY_UNITS = {"b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+
+
+def parse_memory_size(value: str) -> int:
+    """Parses a Redis-style memory size such as "268435456", "512mb" or "2gb"."""
+    value = value.strip().lower()
+    for unit in ("kb", "mb", "gb", "b"):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * MEMORY_UNITS[unit])
+    return int(value)
+
+
+class CountMinSketch:
+    """Approximate per-key counts in fixed memory: depth rows of width counters.
+
+    A key maps to one counter per row by double hashing of its hash(), and
+    its estimate is the smallest of them. Estimates never undercount; with
+    conservative update (only counters below the new estimate are raised)
+    they overcount by well under total * e / width for all but a
+    1 / e^depth fraction of keys.
+    """
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._rows = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key_hash: int) -> list[int]:
+        h1 = key_hash & 0xFFFFFFFF
+        h2 = (key_hash >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key_hash: int, count: int = 1) -> int:
+        indexes = self._indexes(key_hash)
+        estimate = min(row[i] for row, i in zip(self._rows, indexes)) + count
+        for row, i in zip(self._rows, indexes):
+            if row[i] < estimate:
+                row[i] = estimate
+        self.total += count
+        return estimate
+
+    def estimate(self, key_hash: int) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key_hash)))
+
+
+class TopK:
+    """The k keys with the largest counts seen so far, in a min-heap of at most k entries.
+
+    Each tracked key has one heap entry. Counts only grow, so an entry may
+    hold an old, smaller count; those surface at the top of the heap first
+    and are corrected there before anything is evicted.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.counts: dict[str, int] = {}
+        self.labels: dict[str, str] = {}
+        self._heap: list[tuple[int, str]] = []
+
+    def offer(self, key: str, count: int, label: str):
+        if key in self.counts:
+            self.counts[key] = count
+            return
+        if len(self.counts) < self.k:
+            self._add(key, count, label)
+            return
+        if count <= self._heap[0][0]:
+            return
+
+        while True:
+            smallest_count, smallest = self._heap[0]
+            current = self.counts[smallest]
+            if current == smallest_count:
+                break
+            heapq.heapreplace(self._heap, (current, smallest))
+
+        if count > smallest_count:
+            heapq.heappop(self._heap)
+            del self.counts[smallest], self.labels[smallest]
+            self._add(key, count, label)
+
+    def _add(self, key: str, count: int, label: str):
+        self.counts[key] = count
+        self.labels[key] = label
+        heapq.heappush(self._heap, (count, key))
+
+    def ranked(self) -> list[tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+
+
+class SizeSampler:
+    """Stored value sizes for a uniform sample of cache writes, kept as a fixed-size reservoir."""
+
+    def __init__(self, sample_rate: float, capacity: int, seed: Optional[int] = None):
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self.sampled = 0
+        self._samples: list[tuple[int, int]] = []
+        self._rng = random.Random(seed)
+
+    def record(self, key_hash: int, size: int):
+        if self._rng.random() >= self.sample_rate:
+            return
+        self.sampled += 1
+        if len(self._samples) < self.capacity:
+            self._samples.append((key_hash, size))
+            return
+        slot = self._rng.randrange(self.sampled)
+        if slot < self.capacity:
+            self._samples[slot] = (key_hash, size)
+
+    def sizes(self) -> dict[int, int]:
+        return dict(self._samples)
+
+    def mean(self) -> Optional[float]:
+        if not self._samples:
+            return None
+        return sum(size for _, size in self._samples) / len(self._samples)
+
+    def summary(self) -> dict:
+        sizes = sorted(size for _, size in self._samples)
+        if not sizes:
+            return {"samples": 0}
+        return {
+            "samples": len(sizes),
+            "mean_bytes": round(self.mean()),
+            "p50_bytes": sizes[len(sizes) // 2],
+            "p90_bytes": sizes[min(len(sizes) - 1, len(sizes) * 9 // 10)],
+            "p99_bytes": sizes[min(len(sizes) - 1, len(sizes) * 99 // 100)],
+            "max_bytes": sizes[-1]
+        }
+
+
+class AccessLog:
+    """The last capacity cache lookups as (time, key hash), in two ring buffers of 16 bytes per entry."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._times = array('d')
+        self._keys = array('q')
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def append(self, when: float, key_hash: int):
+        if len(self._times) < self.capacity:
+            self._times.append(when)
+            self._keys.append(key_hash)
+            return
+        self._times[self._next] = when
+        self._keys[self._next] = key_hash
+        self._next = (self._next + 1) % self.capacity
+
+    def snapshot(self) -> tuple[array, array]:
+        """Copies of the log in time order, safe to replay off the event loop."""
+        start = self._next
+        return self._times[start:] + self._times[:start], self._keys[start:] + self._keys[:start]
+
+
+def simulate_hit_rate(
+    times: array,
+    keys: array,
+    lifetime: float,
+    maxmemory: Optional[int],
+    sizes: dict[int, int],
+    default_size: float,
+) -> dict:
+    """Replays lookups against a cache whose entries live lifetime seconds from the miss that wrote them.
+
+    Reads do not extend an entry's life, as with SETEX and GET. When
+    maxmemory is set, least recently used entries are evicted (what
+    allkeys-lru approximates) until the entries and their per-key overhead
+    fit. Expired entries hold memory until they are looked up or evicted.
+    """
+    entries: OrderedDict[int, float] = OrderedDict()
+    used = 0.0
+    hits = evictions = expired = 0
+
+    for when, key in zip(times, keys):
+        expiry = entries.get(key)
+        if expiry is not None:
+            if expiry > when:
+                hits += 1
+                entries.move_to_end(key)
+                continue
+            expired += 1
+            del entries[key]
+            used -= sizes.get(key, default_size) + REDIS_KEY_OVERHEAD_BYTES
+
+        entries[key] = when + lifetime
+        used += sizes.get(key, default_size) + REDIS_KEY_OVERHEAD_BYTES
+        while maxmemory is not None and used > maxmemory and entries:
+            evicted, _ = entries.popitem(last=False)
+            used -= sizes.get(evicted, default_size) + REDIS_KEY_OVERHEAD_BYTES
+            evictions += 1
+
+    lookups = len(times)
+    return {
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "hits": hits,
+        "expired_misses": expired,
+        "evictions": evictions,
+        "entries_at_end": len(entries),
+        "bytes_at_end": round(used)
+    }
+
+
+class KeyAnalytics:
+    """Which cache keys dominate lookups, how large their values are, and what other TTLs would have done.
+
+    Every lookup updates a count-min sketch and a top-K of the hottest keys
+    (with a prompt preview), and is appended to a bounded access log. A
+    sample of writes records stored value sizes. simulate() replays the
+    access log at other TTLs and Redis maxmemory limits. All of it is
+    fixed-size and per worker.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        depth: int,
+        top_keys: int,
+        access_log_size: int,
+        size_sample_rate: float,
+        size_samples: int,
+    ):
+        self.width = width
+        self.depth = depth
+        self.top_keys = top_keys
+        self.access_log_size = access_log_size
+        self.size_sample_rate = size_sample_rate
+        self.size_samples = size_samples
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.sketch = CountMinSketch(self.width, self.depth)
+        self.top = TopK(self.top_keys)
+        self.accesses = AccessLog(self.access_log_size)
+        self.sizes = SizeSampler(self.size_sample_rate, self.size_samples)
+
+    def record_access(self, cache_key: str, prompt: str):
+        key_hash = hash(cache_key)
+        self.top.offer(cache_key, self.sketch.add(key_hash), prompt[:80])
+        self.accesses.append(time.time(), key_hash)
+
+    def record_size(self, cache_key: str, size: int):
+        self.sizes.record(hash(cache_key), size)
+
+    def hottest(self, limit: int) -> list[dict]:
+        sizes = self.sizes.sizes()
+        total = self.sketch.total or 1
+        return [
+            {
+                "key": key,
+                "prompt": self.top.labels[key],
+                "lookups": count,
+                "share": round(count / total, 4),
+                "sampled_bytes": sizes.get(hash(key))
+            }
+            for key, count in self.top.ranked()[:limit]
+        ]
+
+    def summary(self) -> dict:
+        return {
+            "since": self.started,
+            "lookups": self.sketch.total,
+            "logged_lookups": len(self.accesses),
+            "value_sizes": self.sizes.summary()
+        }
+
+    def simulation_inputs(self) -> tuple[array, array, dict[int, int], float]:
+        times, keys = self.accesses.snapshot()
+        return times, keys, self.sizes.sizes(), self.sizes.mean() or 0.0
+
+
+def simulate_grid(
+    times: array,
+    keys: array,
+    sizes: dict[int, int],
+    default_size: float,
+    ttls: list[float],
+    maxmemories: list[Optional[int]],
+    stale_seconds: float,
+) -> dict:
+    """Predicted hit rates for every (ttl, maxmemory) pair; entries live ttl + stale_seconds, as they are stored."""
+    lookups = len(times)
+    distinct = len(set(keys))
+    return {
+        "lookups": lookups,
+        "distinct_keys": distinct,
+        "span_seconds": round(times[-1] - times[0], 1) if lookups else 0.0,
+        # Every key's first lookup in the log misses, whatever the TTL or memory.
+        "max_hit_rate": round(1 - distinct / lookups, 4) if lookups else 0.0,
+        "results": [
+            {
+                "ttl_seconds": ttl,
+                "maxmemory": maxmemory,
+                **simulate_hit_rate(times, keys, ttl + stale_seconds, maxmemory, sizes, default_size)
+            }
+            for ttl in ttls
+            for maxmemory in maxmemories
+        ]
+    }
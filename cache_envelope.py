@@ -0,0 +1,57 @@
+import json
+import struct
+import time
+import zlib
+from typing import NamedTuple, Optional, Union
+
+# A NUL byte never starts a model reply, so envelopes cannot be confused with
+# the plain UTF-8 strings written before envelopes existed.
+MAGIC = b"\x00E"
+HEADER = struct.Struct("!2sBH")
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+
+
+class CacheEntry(NamedTuple):
+    text: str
+    metadata: dict
+
+
+def encode_entry(text: str, metadata: Optional[dict] = None, threshold: int = 1024, level: int = 6) -> bytes:
+    """Packs a response and its metadata into the compact binary cache format.
+
+    Layout: magic, codec, metadata length, then the metadata as compact JSON
+    followed by the response text. The body is zlib-compressed when the text
+    is at least threshold bytes and compression actually saves space.
+    """
+    meta = {"created_at": int(time.time()), **(metadata or {})}
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    body = meta_bytes + text.encode("utf-8")
+
+    codec = CODEC_NONE
+    if len(body) - len(meta_bytes) >= threshold:
+        compressed = zlib.compress(body, level)
+        if len(compressed) < len(body):
+            body, codec = compressed, CODEC_ZLIB
+
+    return HEADER.pack(MAGIC, codec, len(meta_bytes)) + body
+
+
+def decode_entry(raw: Union[bytes, str, None]) -> Optional[CacheEntry]:
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        return CacheEntry(raw, {})
+    if not raw.startswith(MAGIC):
+        return CacheEntry(raw.decode("utf-8"), {})
+
+    _, codec, meta_length = HEADER.unpack_from(raw)
+    body = raw[HEADER.size:]
+    if codec == CODEC_ZLIB:
+        body = zlib.decompress(body)
+    elif codec != CODEC_NONE:
+        raise ValueError(f"Unknown cache entry codec: {codec}")
+
+    metadata = json.loads(body[:meta_length]) if meta_length else {}
+    return CacheEntry(body[meta_length:].decode("utf-8"), metadata)
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Optional
+
+from metrics import metrics
+from rate_governor import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class HotKeyTracker:
+    """Decayed hit counts per cache key, with the prompt and model needed to regenerate each entry.
+
+    Scores halve (by default) on every decay() call, so popularity reflects
+    recent traffic. When more than max_keys keys are tracked, the coldest are
+    dropped at the next decay.
+    """
+
+    def __init__(self, max_keys: int, decay_factor: float = 0.5):
+        self.max_keys = max_keys
+        self.decay_factor = decay_factor
+        self._scores: dict[str, float] = {}
+        self._requests: dict[str, tuple[str, Optional[str]]] = {}
+        self._stale: dict[str, tuple[str, Optional[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def record(self, cache_key: str, prompt: str, model: Optional[str] = None, stale: bool = False):
+        self._scores[cache_key] = self._scores.get(cache_key, 0.0) + 1
+        self._requests[cache_key] = (prompt, model)
+        if stale:
+            self._stale[cache_key] = (prompt, model)
+
+    def take_stale(self) -> list[tuple[str, tuple[str, Optional[str]]]]:
+        stale, self._stale = list(self._stale.items()), {}
+        return stale
+
+    def hottest(self, limit: int, min_score: float) -> list[tuple[str, tuple[str, Optional[str]]]]:
+        ranked = sorted(self._scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(key, self._requests[key]) for key, score in ranked if score >= min_score]
+
+    def decay(self):
+        self._scores = {key: score * self.decay_factor for key, score in self._scores.items()}
+        if len(self._scores) > self.max_keys:
+            keep = sorted(self._scores, key=self._scores.get, reverse=True)[:self.max_keys]
+            self._scores = {key: self._scores[key] for key in keep}
+            self._requests = {key: self._requests[key] for key in keep}
+
+
+class CacheRefresher:
+    """Regenerates popular cache entries before they expire and warms the cache at startup.
+
+    Each tick refreshes entries that were served stale since the last tick,
+    then the hottest keys whose fresh lifetime ends within refresh_ahead
+    seconds. Readers keep getting the old value until the new one is
+    written. Refreshes draw from their own requests-per-minute budget and
+    only run while the live LLM budget has headroom, so they never queue
+    ahead of user requests; work that does not fit waits for a later tick.
+    """
+
+    def __init__(
+        self,
+        tracker: HotKeyTracker,
+        get_ttls: Callable[[list[str]], Awaitable[list[Optional[float]]]],
+        refresh: Callable[[str, Optional[str]], Awaitable[Optional[bool]]],
+        has_headroom: Callable[[], bool],
+        requests_per_minute: int,
+        interval: float,
+        refresh_ahead: float,
+        stale_seconds: float,
+        hot_keys: int,
+        min_hits: float,
+    ):
+        self.tracker = tracker
+        self.get_ttls = get_ttls
+        self.refresh = refresh
+        self.has_headroom = has_headroom
+        self.budget = TokenBucket(requests_per_minute)
+        self.interval = interval
+        self.refresh_ahead = refresh_ahead
+        self.stale_seconds = stale_seconds
+        self.hot_keys = hot_keys
+        self.min_hits = min_hits
+        self.stats = {"refreshed": 0, "warmed": 0, "failed": 0, "deferred": 0, "skipped": 0}
+
+    def _take_budget(self) -> bool:
+        if self.budget.time_until(1) > 0 or not self.has_headroom():
+            return False
+        self.budget.consume(1)
+        return True
+
+    async def _refresh(self, prompt: str, model: Optional[str], reason: str):
+        try:
+            refreshed = await self.refresh(prompt, model)
+        except Exception as e:
+            logger.warning(f"Cache refresh failed ({reason}): {e}")
+            refreshed = False
+
+        # None means another worker is already regenerating the entry.
+        if refreshed is None:
+            outcome = "skipped"
+        elif not refreshed:
+            outcome = "failed"
+        else:
+            outcome = "warmed" if reason == "warmup" else "refreshed"
+        self.stats[outcome] += 1
+        metrics.increment('gemini_chat_api.cache.refresh', tags=(f'reason:{reason}', f'outcome:{outcome}'))
+
+    async def tick(self):
+        due = {key: (request, "stale") for key, request in self.tracker.take_stale()}
+
+        hot = [(key, request) for key, request in self.tracker.hottest(self.hot_keys, self.min_hits) if key not in due]
+        if hot:
+            ttls = await self.get_ttls([key for key, _ in hot])
+            for (key, request), ttl in zip(hot, ttls):
+                if ttl is not None and ttl - self.stale_seconds <= self.refresh_ahead:
+                    due[key] = (request, "ahead")
+
+        self.tracker.decay()
+
+        for i, ((prompt, model), reason) in enumerate(due.values()):
+            if not self._take_budget():
+                # Deferred keys come back on their next stale hit or while still hot.
+                self.stats["deferred"] += len(due) - i
+                break
+            await self._refresh(prompt, model, reason)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Cache refresher tick failed: {e}")
+
+    async def warm(self, prompts: list[str], find_uncached: Callable[[list[str]], Awaitable[list[str]]]):
+        pending = await find_uncached(prompts)
+        logger.info(f"Cache warm-up: {len(pending)} of {len(prompts)} prompts not cached")
+
+        for prompt in pending:
+            while not self._take_budget():
+                await asyncio.sleep(max(self.budget.time_until(1), 1.0))
+            await self._refresh(prompt, None, "warmup")
+
+        logger.info(f"Cache warm-up finished: {self.stats['warmed']} entries generated")
+
+
+def load_warmup_prompts(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        prompts = json.load(f)
+    return [prompt for prompt in prompts if isinstance(prompt, str) and prompt.strip()]
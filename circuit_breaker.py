@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency and probes it in the background until it recovers.
+
+    closed: calls go through. failure_threshold failures within
+    failure_window seconds (or one trip(), for a refused connection) open
+    the circuit.
+    open: allow() is False, so callers skip the dependency at once instead
+    of each waiting for a timeout. A background task waits reset_timeout
+    and then moves to half_open.
+    half_open: the probe runs once, still off the request path. Success
+    closes the circuit; failure reopens it with the wait doubled, up to
+    max_reset_timeout.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        probe: Callable[[], Awaitable[None]],
+        failure_threshold: int = 5,
+        failure_window: float = 10.0,
+        reset_timeout: float = 2.0,
+        max_reset_timeout: float = 30.0,
+        tags: tuple[str, ...] = (),
+    ):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.tags = tags + (f'breaker:{name}',)
+        self.state = CLOSED
+        self.transitions = 0
+        self.last_error: Optional[str] = None
+        self._failures: deque[float] = deque()
+        self._opened_at = 0.0
+        self._next_probe_at = 0.0
+        self._recovery: Optional[asyncio.Task] = None
+
+    def allow(self) -> bool:
+        return self.state == CLOSED
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        metrics.increment('gemini_chat_api.circuit.transition', tags=self.tags + (f'from:{self.state}', f'to:{state}'))
+        metrics.gauge('gemini_chat_api.circuit.state', STATE_VALUES[state], tags=self.tags)
+        self.state = state
+        self.transitions += 1
+
+    def record_failure(self, error: Optional[Exception] = None):
+        if self.state != CLOSED:
+            return
+
+        now = time.monotonic()
+        self._failures.append(now)
+        while self._failures and self._failures[0] < now - self.failure_window:
+            self._failures.popleft()
+        if len(self._failures) >= self.failure_threshold:
+            self.trip(error)
+
+    def trip(self, error: Optional[Exception] = None):
+        if self.state != CLOSED:
+            return
+
+        self.last_error = str(error) if error else None
+        self._failures.clear()
+        self._opened_at = time.monotonic()
+        self._transition(OPEN)
+        self._recovery = asyncio.get_running_loop().create_task(self._recover())
+
+    async def _recover(self):
+        delay = self.reset_timeout
+        while True:
+            self._next_probe_at = time.monotonic() + delay
+            await asyncio.sleep(delay)
+
+            self._transition(HALF_OPEN)
+            try:
+                await self.probe()
+            except Exception as e:
+                self.last_error = str(e)
+                delay = min(delay * 2, self.max_reset_timeout)
+                self._transition(OPEN)
+                logger.warning(f"Circuit breaker {self.name} probe failed, next probe in {delay:.1f}s: {e}")
+                continue
+
+            self.last_error = None
+            self._transition(CLOSED)
+            return
+
+    def reset(self, cancel: bool = True):
+        """Forgets past failures and any recovery in progress, e.g. on shutdown.
+
+        Pass cancel=False in a forked child, where the recovery task belongs
+        to the parent's event loop and must only be dropped.
+        """
+        if self._recovery is not None and cancel:
+            self._recovery.cancel()
+        self._recovery = None
+        self._failures.clear()
+        self.state = CLOSED
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        snapshot = {
+            "state": self.state,
+            "recent_failures": len(self._failures),
+            "transitions": self.transitions,
+            "last_error": self.last_error
+        }
+        if self.state != CLOSED:
+            snapshot["open_seconds"] = round(now - self._opened_at, 1)
+            snapshot["next_probe_in_seconds"] = round(max(0.0, self._next_probe_at - now), 1)
+        return snapshot
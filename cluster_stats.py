@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def merge_stats(total: dict, stats: dict) -> dict:
+    """Adds the numeric leaves of stats into total, recursing into nested dicts."""
+    for name, value in stats.items():
+        if isinstance(value, dict):
+            merge_stats(total.setdefault(name, {}), value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[name] = total.get(name, 0) + value
+    return total
+
+
+class ClusterStats:
+    """Shares each worker's counters through one Redis hash so /health can report cluster-wide figures.
+
+    Every interval, a worker writes its collect() snapshot into the hash
+    under its own field. aggregate() reads the whole hash with one HGETALL
+    and sums the snapshots. Fields not updated for three intervals belong
+    to workers that died or were scaled away; they are skipped and deleted.
+    """
+
+    def __init__(
+        self,
+        get_client: Callable[[], Awaitable[Optional[aioredis.Redis]]],
+        collect: Callable[[], dict],
+        interval: float,
+        key: str = "gemini:cluster:workers",
+    ):
+        self.get_client = get_client
+        self.collect = collect
+        self.interval = interval
+        self.key = key
+        self.worker_id = worker_id()
+
+    async def publish(self):
+        client = await self.get_client()
+        if client is None:
+            return
+
+        snapshot = json.dumps({"updated": time.time(), "stats": self.collect()})
+        try:
+            await client.hset(self.key, self.worker_id, snapshot)
+        except redis.RedisError as e:
+            metrics.increment('gemini_chat_api.redis.error')
+            logger.error(f"Redis error publishing worker stats: {e}")
+
+    async def run(self):
+        while True:
+            await self.publish()
+            await asyncio.sleep(self.interval)
+
+    async def aggregate(self) -> Optional[dict]:
+        client = await self.get_client()
+        if client is None:
+            return None
+
+        try:
+            workers = await client.hgetall(self.key)
+        except redis.RedisError as e:
+            metrics.increment('gemini_chat_api.redis.error')
+            logger.error("Redis error reading worker stats: %s", e)
+            return None
+
+        cutoff = time.time() - 3 * self.interval
+        total: dict = {}
+        live = 0
+        expired = []
+        for worker, raw in workers.items():
+            entry = json.loads(raw)
+            if entry["updated"] < cutoff:
+                expired.append(worker)
+                continue
+            live += 1
+            merge_stats(total, entry["stats"])
+
+        if expired:
+            try:
+                await client.hdel(self.key, *expired)
+            except redis.RedisError as e:
+                logger.error(f"Redis error removing expired worker stats: {e}")
+
+        return {"workers": live, **total}
+
+    async def close(self):
+        client = await self.get_client()
+        if client is None:
+            return
+        try:
+            await client.hdel(self.key, self.worker_id)
+        except redis.RedisError as e:
+            logger.error(f"Redis error removing worker stats: {e}")
@@ -5,21 +5,127 @@ from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
-    gemini_api_key: str
+    gemini_api_key: Optional[str] = None
     gemini_model: str = "gemini-flash-latest"
+    model_provider: str = "gemini"
+    fake_model_latency_ms: float = 500.0
+    fake_model_latency_distribution: str = "lognormal"
+    fake_model_latency_jitter: float = 0.5
+    fake_model_output_tokens: int = 256
+    fake_model_stream_chunks: int = 8
+    fake_model_chunk_delay_ms: float = 20.0
+    fake_model_error_rate: float = 0.0
+    fake_model_seed: Optional[int] = None
+    
+    model_routes: list[str] = []
+    model_fallback: Optional[str] = None
+    model_costs: dict[str, float] = {}
+    model_max_prompt_chars: dict[str, int] = {}
+    model_cost_weight_seconds: float = 0.5
+    model_error_penalty_seconds: float = 10.0
+    model_latency_ewma_alpha: float = 0.2
+    model_explore_rate: float = 0.05
+    model_hedge_enabled: bool = True
+    model_hedge_percentile: float = 95.0
+    model_hedge_min_delay_seconds: float = 0.1
+    model_hedge_min_samples: int = 20
+    model_hedge_reserve_fraction: float = 0.5
+    model_latency_window: int = 200
+    
+    gzip_minimum_size: int = 1000
+    gzip_compress_level: int = 6
+    
+    startup_mode: str = "background"
+    web_concurrency: int = 1
+    cluster_stats_interval_seconds: float = 5.0
     
     dd_service: str = "gemini-chat-api"
     dd_env: str = "development"
     dd_version: str = "1.0.0"
     dd_api_key: Optional[str] = None
     dd_app_key: Optional[str] = None
+    metrics_flush_interval_seconds: float = 2.0
+    metrics_max_histogram_samples: int = 1000
+    log_level: str = "INFO"
+    log_format: str = "text"
+    log_queue_size: int = 10000
+    log_repeat_burst: int = 5
+    log_repeat_window_seconds: float = 10.0
+    admin_token: Optional[str] = None
+    profile_max_seconds: float = 60.0
     
     redis_host: str = "redis"
     redis_port: int = 6379
     redis_db: int = 0
+    redis_max_connections: int = 50
+    redis_pool_timeout_seconds: float = 5.0
+    # Cache calls fail fast when Redis hangs; the breaker then skips it entirely.
+    redis_connect_timeout_seconds: float = 0.25
+    redis_socket_timeout_seconds: float = 0.25
+    redis_breaker_failure_threshold: int = 5
+    redis_breaker_failure_window_seconds: float = 10.0
+    redis_breaker_reset_seconds: float = 2.0
+    redis_breaker_max_reset_seconds: float = 30.0
     cache_ttl_seconds: int = 3600
+    cache_compression_threshold_bytes: int = 512
+    cache_compression_level: int = 6
+    cache_stale_seconds: int = 600
+    cache_refresh_enabled: bool = True
+    cache_refresh_interval_seconds: float = 10.0
+    cache_refresh_ahead_seconds: int = 300
+    cache_refresh_hot_keys: int = 100
+    cache_refresh_min_hits: float = 3.0
+    cache_refresh_tracked_keys: int = 10000
+    cache_refresh_requests_per_minute: int = 30
+    cache_refresh_reserve_fraction: float = 0.2
+    cache_warmup_file: Optional[str] = None
+    cache_warmup_claim_seconds: int = 600
+    local_cache_max_entries: int = 1024
+    local_cache_max_bytes: int = 16 * 1024 * 1024
+    local_cache_ttl_seconds: int = 300
+    cache_analytics_sketch_width: int = 4096
+    cache_analytics_sketch_depth: int = 4
+    cache_analytics_top_keys: int = 100
+    cache_analytics_access_log_size: int = 100000
+    cache_analytics_size_sample_rate: float = 0.1
+    cache_analytics_size_samples: int = 2048
+    cache_simulation_max_runs: int = 40
+    
+    # "case" and "punctuation" are opt-in: they merge prompts that differ in meaning ("C++" and "C", "2+2" and "22").
+    prompt_normalization: list[str] = ["whitespace"]
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.9
+    semantic_cache_max_entries: int = 10000
+    semantic_cache_dimensions: int = 256
+    
+    llm_timeout_seconds: float = 30.0
+    llm_stream_timeout_seconds: float = 120.0
+    llm_max_concurrency: int = 256
+    llm_requests_per_minute: int = 1000
+    llm_tokens_per_minute: int = 1000000
+    llm_max_queue: int = 1000
+    llm_max_queue_wait_seconds: float = 30.0
+    llm_max_retries: int = 2
+    llm_backoff_base_seconds: float = 0.5
+    llm_backoff_max_seconds: float = 8.0
+    singleflight_redis_lock: bool = False
+    user_rate_limit_enabled: bool = True
+    user_rate_limit_per_minute: int = 60
+    user_rate_limit_burst: int = 20
+    batch_max_items: int = 100
+    batch_max_concurrency: int = 16
+    
+    history_backend: str = "memory"
+    history_max_length: int = 1000
+    history_scope_max_length: int = 200
+    history_flush_interval_seconds: float = 0.05
+    history_subscriber_queue_size: int = 100
+    history_heartbeat_seconds: float = 15.0
     
     jailbreak_keywords: list[str] = ["ignore"]
+    jailbreak_rules_file: Optional[str] = None
+    jailbreak_threshold: float = 1.0
+    jailbreak_rules_reload_seconds: int = 30
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,50 @@
+import asyncio
+import json
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class HistoryHub:
+    """Fans new history entries out to every connected push subscriber in this worker.
+
+    Each entry is serialized into its SSE frame once and the same string is
+    queued for every subscriber, so publishing costs one encode plus one queue
+    put per subscriber. A subscriber whose queue fills up is disconnected
+    rather than allowed to buffer without bound; the client reconnects with
+    Last-Event-ID and catches up from the history store.
+    """
+
+    def __init__(self, max_queue: int):
+        self.max_queue = max_queue
+        self.disconnected_slow = 0
+        self._subscribers: set[asyncio.Queue] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, entry_id: str, entry: dict):
+        if not self._subscribers:
+            return
+
+        event = f"id: {entry_id}\ndata: {json.dumps({'id': entry_id, **entry})}\n\n"
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((entry_id, event))
+            except asyncio.QueueFull:
+                self._disconnect(queue)
+
+    def _disconnect(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        self.disconnected_slow += 1
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    @contextmanager
+    def subscribe(self) -> Iterator[asyncio.Queue[Optional[tuple[str, str]]]]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
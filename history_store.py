@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+STREAM_ID_RE = re.compile(r"^\d+-\d+$")
+
+# How long a flush waits before retrying while Redis is unavailable.
+FLUSH_RETRY_SECONDS = 1.0
+
+
+class HistoryUnavailable(Exception):
+    """Raised when the history backend cannot serve a read."""
+
+
+def parse_stream_id(stream_id: str) -> tuple[int, int]:
+    if not STREAM_ID_RE.match(stream_id):
+        raise ValueError(f"Invalid history cursor: {stream_id}")
+    ms, seq = stream_id.split("-")
+    return int(ms), int(seq)
+
+
+def since_to_stream_id(since_ms: int) -> str:
+    # Stream IDs start with the append time in ms, so "after <ms-1>-<max>" means "at or after ms".
+    return f"{since_ms - 1}-18446744073709551615"
+
+
+def _region_slug(region: str) -> str:
+    return region.lower().replace(" ", "_")
+
+
+def build_page(items: list[tuple[str, dict]], limit: int) -> dict:
+    messages = [{"id": item_id, **entry} for item_id, entry in items[:limit]]
+    return {
+        "messages": messages,
+        "next_cursor": messages[-1]["id"] if messages else None,
+        "prev_cursor": messages[0]["id"] if messages else None,
+    }
+
+
+class MemoryHistoryStore:
+    """Process-local history with stream-style IDs, used when Redis is not configured."""
+
+    def __init__(self, max_length: int):
+        self._entries: deque[tuple[str, dict, str]] = deque(maxlen=max_length)
+        self._last_id = (0, 0)
+        self._listeners: list[Callable[[str, dict], None]] = []
+
+    def append(self, entry: dict, region: str) -> None:
+        ms = int(time.time() * 1000)
+        last_ms, last_seq = self._last_id
+        self._last_id = (last_ms, last_seq + 1) if ms <= last_ms else (ms, 0)
+        entry_id = f"{self._last_id[0]}-{self._last_id[1]}"
+        self._entries.append((entry_id, entry, _region_slug(region)))
+
+        for listener in self._listeners:
+            listener(entry_id, entry)
+
+    async def tail(self, callback: Callable[[str, dict], None]):
+        self._listeners.append(callback)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self._listeners.remove(callback)
+
+    async def read(
+        self,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 50,
+        user_id: Optional[str] = None,
+        region: Optional[str] = None,
+    ) -> dict:
+        region_slug = _region_slug(region) if region is not None else None
+        items = [
+            (entry_id, entry) for entry_id, entry, entry_region in self._entries
+            if (user_id is None or entry.get("user_id") == user_id)
+            and (region_slug is None or entry_region == region_slug)
+        ]
+
+        if after is not None:
+            after_key = parse_stream_id(after)
+            items = [item for item in items if parse_stream_id(item[0]) > after_key][:limit]
+        else:
+            if before is not None:
+                before_key = parse_stream_id(before)
+                items = [item for item in items if parse_stream_id(item[0]) < before_key]
+            items = items[-limit:]
+
+        return build_page(items, limit)
+
+    async def close(self):
+        pass
+
+
+class RedisHistoryStore:
+    """Chat history kept in capped Redis Streams: one global stream plus one per user and per region.
+
+    Appends are buffered in memory and flushed by a background task in a
+    single pipeline, so request handlers never wait on Redis. Reads use
+    XRANGE/XREVRANGE with the stream IDs as cursors.
+    """
+
+    def __init__(
+        self,
+        get_client: Callable[[], Awaitable[Optional[aioredis.Redis]]],
+        max_length: int,
+        scope_max_length: int,
+        flush_interval: float,
+        tags: tuple[str, ...] = (),
+        key_prefix: str = "gemini:history",
+        on_error: Callable[[Exception], None] = lambda e: None,
+        get_tail_client: Optional[Callable[[], Awaitable[Optional[aioredis.Redis]]]] = None,
+        tail_block_ms: int = 2000,
+    ):
+        self.get_client = get_client
+        self.get_tail_client = get_tail_client or get_client
+        self.tail_block_ms = tail_block_ms
+        self.on_error = on_error
+        self.max_length = max_length
+        self.scope_max_length = scope_max_length
+        self.flush_interval = flush_interval
+        self.tags = tags
+        self.key_prefix = key_prefix
+        self._pending: deque[tuple[dict, str]] = deque(maxlen=max_length)
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+
+    def stream_key(self, user_id: Optional[str] = None, region: Optional[str] = None) -> str:
+        if user_id is not None:
+            return f"{self.key_prefix}:user:{user_id}"
+        if region is not None:
+            return f"{self.key_prefix}:region:{_region_slug(region)}"
+        return self.key_prefix
+
+    def append(self, entry: dict, region: str) -> None:
+        self._pending.append((entry, region))
+        self._wakeup.set()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if await self.flush():
+                await asyncio.sleep(self.flush_interval)
+            else:
+                # The entries are still pending; come back for them even if nothing else is appended.
+                self._wakeup.set()
+                await asyncio.sleep(max(self.flush_interval, FLUSH_RETRY_SECONDS))
+
+    async def flush(self) -> bool:
+        """Writes pending entries; False when Redis was unavailable and they are still pending."""
+        if not self._pending:
+            return True
+
+        client = await self.get_client()
+        if client is None:
+            return False
+
+        batch = list(self._pending)
+        self._pending.clear()
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                for entry, region in batch:
+                    fields = {"data": json.dumps(entry)}
+                    pipe.xadd(self.stream_key(), fields, maxlen=self.max_length, approximate=True)
+                    # The user stream also records the region, so reads by user and region can filter on it.
+                    user_fields = {**fields, "region": _region_slug(region)}
+                    pipe.xadd(self.stream_key(user_id=entry["user_id"]), user_fields, maxlen=self.scope_max_length, approximate=True)
+                    pipe.xadd(self.stream_key(region=region), fields, maxlen=self.scope_max_length, approximate=True)
+                await pipe.execute()
+        except redis.RedisError as e:
+            self._pending.extendleft(reversed(batch))
+            metrics.increment('gemini_chat_api.redis.error', tags=self.tags)
+            self.on_error(e)
+            logger.error("Redis error writing chat history: %s", e)
+            return False
+
+        return True
+
+    async def read(
+        self,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        limit: int = 50,
+        user_id: Optional[str] = None,
+        region: Optional[str] = None,
+    ) -> dict:
+        client = await self.get_client()
+        if client is None:
+            raise HistoryUnavailable("Redis is not available")
+
+        if after is not None:
+            parse_stream_id(after)
+        elif before is not None:
+            parse_stream_id(before)
+
+        key = self.stream_key(user_id=user_id, region=region)
+        # With both filters the user stream is read and filtered by region, as MemoryHistoryStore does.
+        region_slug = _region_slug(region) if user_id is not None and region is not None else None
+        try:
+            items = await self._read_range(client, key, after, before, limit, region_slug)
+        except redis.RedisError as e:
+            metrics.increment('gemini_chat_api.redis.error', tags=self.tags)
+            self.on_error(e)
+            logger.error("Redis error reading chat history: %s", e)
+            raise HistoryUnavailable(str(e))
+
+        return build_page([(entry_id, json.loads(fields["data"])) for entry_id, fields in items], limit)
+
+    async def _read_range(
+        self,
+        client: aioredis.Redis,
+        key: str,
+        after: Optional[str],
+        before: Optional[str],
+        limit: int,
+        region_slug: Optional[str],
+    ) -> list[tuple[str, dict]]:
+        """Up to limit entries in stream order, fetching further pages while the region filter drops some."""
+        items: list[tuple[str, dict]] = []
+        while True:
+            if after is not None:
+                page = await client.xrange(key, min=f"({after}", max="+", count=limit)
+            elif before is not None:
+                page = await client.xrevrange(key, max=f"({before}", min="-", count=limit)
+            else:
+                page = await client.xrevrange(key, count=limit)
+
+            items.extend(page if region_slug is None else [item for item in page if item[1].get("region") == region_slug])
+            if region_slug is None or len(items) >= limit or len(page) < limit:
+                break
+            if after is not None:
+                after = page[-1][0]
+            else:
+                before = page[-1][0]
+
+        items = items[:limit]
+        # XREVRANGE pages run newest first.
+        return items if after is not None else list(reversed(items))
+
+    async def tail(self, callback: Callable[[str, dict], None]):
+        # One blocking XREAD per worker picks up entries written by every replica.
+        last_id = "$"
+        while True:
+            client = await self.get_tail_client()
+            if client is None:
+                await asyncio.sleep(1)
+                continue
+
+            try:
+                response = await client.xread({self.stream_key(): last_id}, block=self.tail_block_ms, count=100)
+            except redis.RedisError as e:
+                self.on_error(e)
+                logger.error(f"Redis error tailing chat history: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for _, items in response or []:
+                for entry_id, fields in items:
+                    last_id = entry_id
+                    callback(entry_id, json.loads(fields["data"]))
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self.flush()
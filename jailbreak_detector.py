@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+from typing import NamedTuple, Optional
+
+import ahocorasick
+
+logger = logging.getLogger(__name__)
+
+
+class JailbreakRule(NamedTuple):
+    phrase: str
+    weight: float = 1.0
+    word_boundary: bool = True
+
+
+class Detection(NamedTuple):
+    blocked: bool
+    score: float
+    matches: list[str]
+
+
+def _normalize_phrase(phrase: str) -> str:
+    return " ".join(phrase.lower().split())
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+def _on_word_boundaries(text: str, start: int, end: int) -> bool:
+    # The same test as regex \b at both ends of text[start:end + 1].
+    before = start > 0 and _is_word_char(text[start - 1])
+    after = end + 1 < len(text) and _is_word_char(text[end + 1])
+    return before != _is_word_char(text[start]) and after != _is_word_char(text[end])
+
+
+class _CompiledRules(NamedTuple):
+    weights: dict[str, float]
+    automaton: Optional[ahocorasick.Automaton]
+
+
+def _compile(rules: list[JailbreakRule]) -> _CompiledRules:
+    """Builds one Aho-Corasick automaton over every phrase.
+
+    A prompt is scanned in a single pass whose cost depends on its length
+    and the number of matches, not on how many rules there are. A phrase
+    listed both as a keyword and as a word-boundary rule keeps the looser
+    substring match.
+    """
+    weights: dict[str, float] = {}
+    word_boundary: dict[str, bool] = {}
+
+    for rule in rules:
+        phrase = _normalize_phrase(rule.phrase)
+        if not phrase:
+            continue
+        weights[phrase] = max(weights.get(phrase, 0.0), rule.weight)
+        word_boundary[phrase] = word_boundary.get(phrase, True) and rule.word_boundary
+
+    if not weights:
+        return _CompiledRules(weights=weights, automaton=None)
+
+    automaton = ahocorasick.Automaton()
+    for phrase, boundary in word_boundary.items():
+        automaton.add_word(phrase, (phrase, boundary))
+    automaton.make_automaton()
+    return _CompiledRules(weights=weights, automaton=automaton)
+
+
+class JailbreakDetector:
+    """Weighted phrase matcher compiled once and swapped atomically on reload.
+
+    Plain keywords match anywhere in the prompt, as the original keyword
+    check did. Rules loaded from a JSON file may set a weight and whether the
+    phrase must sit on word boundaries. A prompt is blocked when the summed
+    weight of the distinct rules it matches reaches the threshold.
+    """
+
+    def __init__(self, keywords: list[str], rules_file: Optional[str], threshold: float):
+        self.keywords = keywords
+        self.rules_file = rules_file
+        self.threshold = threshold
+        self._rules_mtime: Optional[float] = None
+        self._compiled = _compile([])
+        self.reload()
+
+    @property
+    def rule_count(self) -> int:
+        return len(self._compiled.weights)
+
+    def _load_rules(self) -> list[JailbreakRule]:
+        rules = [JailbreakRule(keyword, word_boundary=False) for keyword in self.keywords]
+        if not self.rules_file:
+            return rules
+
+        with open(self.rules_file, encoding="utf-8") as f:
+            for entry in json.load(f):
+                if isinstance(entry, str):
+                    rules.append(JailbreakRule(entry))
+                else:
+                    rules.append(JailbreakRule(
+                        entry["phrase"],
+                        float(entry.get("weight", 1.0)),
+                        bool(entry.get("word_boundary", True))
+                    ))
+        return rules
+
+    def reload(self) -> bool:
+        try:
+            mtime = os.path.getmtime(self.rules_file) if self.rules_file else None
+            compiled = _compile(self._load_rules())
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Failed to load jailbreak rules, keeping previous rules: {e}")
+            return False
+
+        self._compiled = compiled
+        self._rules_mtime = mtime
+        logger.info(f"Loaded {len(compiled.weights)} jailbreak rules")
+        return True
+
+    def reload_if_changed(self) -> bool:
+        if not self.rules_file:
+            return False
+        try:
+            mtime = os.path.getmtime(self.rules_file)
+        except OSError as e:
+            logger.error(f"Cannot stat jailbreak rules file: {e}")
+            return False
+        return mtime != self._rules_mtime and self.reload()
+
+    def scan(self, prompt: str) -> Detection:
+        compiled = self._compiled
+        matched: set[str] = set()
+        if compiled.automaton is None:
+            return Detection(blocked=False, score=0.0, matches=[])
+
+        # Phrases are stored with single spaces, so runs of whitespace in the prompt collapse the same way.
+        text = _normalize_phrase(prompt)
+        for end, (phrase, word_boundary) in compiled.automaton.iter(text):
+            if phrase not in matched and (not word_boundary or _on_word_boundaries(text, end - len(phrase) + 1, end)):
+                matched.add(phrase)
+
+        score = sum(compiled.weights.get(phrase, 0.0) for phrase in matched)
+        return Detection(blocked=score >= self.threshold and score > 0, score=score, matches=sorted(matched))
@@ -0,0 +1,117 @@
+import atexit
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from pythonjsonlogger.core import RESERVED_ATTRS
+
+from metrics import Counters, metrics
+from timezone_formatter import SingaporeJsonFormatter
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+log_stats = Counters("suppressed", "dropped")
+
+
+class RepeatFilter(logging.Filter):
+    """Lets through at most burst records per call site every window seconds, from min_level up.
+
+    During a Redis outage every request logs the same error from the same
+    line; past the burst those records are dropped before they are
+    formatted or queued. The first record let through after a suppressed
+    stretch says how many were dropped.
+    """
+
+    def __init__(self, burst: int, window: float, min_level: int = logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.min_level = min_level
+        self._sites: dict[tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.min_level:
+            return True
+
+        now = time.monotonic()
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            state = self._sites.get(site)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._sites[site] = [now, 1, 0]
+            elif state[1] < self.burst:
+                state[1] += 1
+                suppressed = 0
+            else:
+                state[2] += 1
+                log_stats.add("suppressed")
+                metrics.increment('gemini_chat_api.logs.suppressed')
+                return False
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the listener falls behind instead of blocking the caller."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener is a thread in this process, so the record needs no copying or pre-formatting
+        # to cross the queue; leave all formatting to the listener.
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_stats.add("dropped")
+            metrics.increment('gemini_chat_api.logs.dropped')
+
+
+def create_formatter(log_format: str) -> logging.Formatter:
+    if log_format == "json":
+        # uvicorn attaches an ANSI-coloured copy of some messages; keep it out of the JSON.
+        return SingaporeJsonFormatter(
+            '%(name)s %(levelname)s %(message)s',
+            timestamp=True,
+            reserved_attrs=[*RESERVED_ATTRS, "color_message"]
+        )
+    if log_format == "text":
+        return logging.Formatter(TEXT_FORMAT)
+    raise ValueError(f"Unknown log format: {log_format}")
+
+
+def configure_logging(settings, stream=None) -> QueueListener:
+    """Routes the root logger through a bounded queue to a listener thread that formats and writes.
+
+    Callers, including the event loop, only pay for the repeat filter and
+    an enqueue; JSON formatting and the stream write happen on the
+    listener thread. uvicorn's loggers are pointed at the same queue.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(create_formatter(settings.log_format))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RepeatFilter(settings.log_repeat_burst, settings.log_repeat_window_seconds))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(settings.log_level.upper())
+
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
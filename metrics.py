@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+from typing import Optional
+
+from datadog.dogstatsd import DogStatsd
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+Context = tuple[str, tuple[str, ...]]
+
+
+class Counters:
+    """Named integer counters that are safe to update from any thread."""
+
+    def __init__(self, *names: str):
+        self._values = dict.fromkeys(names, 0)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: int = 1):
+        with self._lock:
+            self._values[name] += value
+
+    def __getitem__(self, name: str) -> int:
+        return self._values[name]
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        # A fresh lock too: after fork, the inherited one may be held by a thread that no longer exists.
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(self._values, 0)
+
+
+class MetricsBuffer:
+    """Aggregates metrics in-process and ships them to DogStatsD in batches.
+
+    Recording a metric only updates a dict under a lock: counters are
+    summed and gauges keep their last value per (name, tags) context, and
+    histogram samples are kept up to max_samples per context and flush
+    interval. The env tag is attached by the client as a constant tag, so
+    callers pass only their extra tags, ideally as pre-built tuples. A
+    background task swaps the buffers out and sends them through a
+    buffering client, which packs many metrics into each UDP datagram.
+    """
+
+    def __init__(self, client: Optional[DogStatsd], flush_interval: float, max_samples: int):
+        self.client = client
+        self.flush_interval = flush_interval
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counts: dict[Context, float] = {}
+        self._gauges: dict[Context, float] = {}
+        self._histograms: dict[Context, list[float]] = {}
+        self._histogram_seen: dict[Context, int] = {}
+
+    def increment(self, name: str, value: float = 1, tags: tuple[str, ...] = ()):
+        key = (name, tags)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, tags: tuple[str, ...] = ()):
+        with self._lock:
+            self._gauges[(name, tags)] = value
+
+    def histogram(self, name: str, value: float, tags: tuple[str, ...] = ()):
+        key = (name, tags)
+        with self._lock:
+            seen = self._histogram_seen.get(key, 0) + 1
+            self._histogram_seen[key] = seen
+            samples = self._histograms.setdefault(key, [])
+            if len(samples) < self.max_samples:
+                samples.append(value)
+            else:
+                # Reservoir sampling keeps a uniform sample of the interval's values.
+                slot = random.randrange(seen)
+                if slot < self.max_samples:
+                    samples[slot] = value
+
+    def discard(self):
+        """Drops everything buffered, e.g. samples a forked worker inherited from its parent."""
+        self._lock = threading.Lock()
+        self._counts, self._gauges, self._histograms, self._histogram_seen = {}, {}, {}, {}
+
+    def flush(self) -> int:
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            gauges, self._gauges = self._gauges, {}
+            histograms, self._histograms = self._histograms, {}
+            seen, self._histogram_seen = self._histogram_seen, {}
+
+        if self.client is None:
+            return 0
+
+        dropped = sum(seen[key] - len(samples) for key, samples in histograms.items())
+        if dropped:
+            counts[('gemini_chat_api.metrics.samples_dropped', ())] = dropped
+
+        for (name, tags), value in counts.items():
+            self.client.increment(name, value, tags=list(tags))
+        for (name, tags), value in gauges.items():
+            self.client.gauge(name, value, tags=list(tags))
+        for (name, tags), samples in histograms.items():
+            # Past max_samples the reservoir holds a sample of the interval, so each value is sent with
+            # its sample rate and the agent scales .count and the rate back up. Sent with sampling off,
+            # as the client's own aggregator does for sampled metrics; histogram() would drop values
+            # at random again.
+            sample_rate = len(samples) / seen[(name, tags)]
+            for value in samples:
+                self.client._report(name, "h", value, list(tags), sample_rate, sampling=False)
+        self.client.flush()
+
+        return len(counts) + len(gauges) + len(histograms)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"Failed to flush metrics: {e}")
+
+
+def create_statsd_client() -> Optional[DogStatsd]:
+    try:
+        return DogStatsd(
+            host=os.getenv('DD_AGENT_HOST', '127.0.0.1'),
+            port=8125,
+            constant_tags=[f'env:{settings.dd_env}'],
+            disable_buffering=False,
+        )
+    except Exception as e:
+        logger.warning(f"StatsD client unavailable, metrics will be dropped: {e}")
+        return None
+
+
+metrics = MetricsBuffer(
+    client=create_statsd_client(),
+    flush_interval=settings.metrics_flush_interval_seconds,
+    max_samples=settings.metrics_max_histogram_samples,
+)
+# The DogStatsd client reopens its socket after fork by itself; the buffer must not be sent twice.
+os.register_at_fork(after_in_child=metrics.discard)
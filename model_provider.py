@@ -0,0 +1,213 @@
+import asyncio
+import functools
+import logging
+import math
+import random
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Optional, Protocol
+
+from google.api_core.exceptions import ResourceExhausted
+
+from config import Settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "exponential", "lognormal")
+
+
+class ModelProvider(Protocol):
+    """The part of google.generativeai.GenerativeModel the API depends on."""
+
+    model_name: str
+
+    async def generate_content_async(self, prompt: str, stream: bool = False) -> Any:
+        ...
+
+
+def usage_metadata(prompt_tokens: int, output_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+    )
+
+
+class FakeResponse:
+    def __init__(self, text: str, prompt_tokens: int, output_tokens: int):
+        self.text = text
+        self.usage_metadata = usage_metadata(prompt_tokens, output_tokens)
+
+
+class FakeStreamResponse:
+    """Yields the reply in chunks; usage_metadata is filled in once the stream is consumed, like Gemini's."""
+
+    def __init__(self, chunks: list[str], chunk_delay: float, prompt_tokens: int, output_tokens: int):
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.text = ""
+        self.usage_metadata = None
+        self._prompt_tokens = prompt_tokens
+        self._output_tokens = output_tokens
+
+    async def __aiter__(self) -> AsyncIterator[SimpleNamespace]:
+        for i, chunk in enumerate(self.chunks):
+            if i:
+                await asyncio.sleep(self.chunk_delay)
+            self.text += chunk
+            yield SimpleNamespace(text=chunk)
+        self.usage_metadata = usage_metadata(self._prompt_tokens, self._output_tokens)
+
+
+class FakeModel:
+    """Local stand-in for Gemini for offline load tests and benchmarks.
+
+    Latency is drawn from the configured distribution around latency_ms
+    (jitter is the spread: the half-width for uniform, sigma for lognormal).
+    For streaming calls that latency is the time to first chunk, and the
+    remaining chunks follow chunk_delay_ms apart. Replies are about
+    output_tokens tokens long. A fraction error_rate of calls raise
+    ResourceExhausted, as Gemini does on quota errors. With a seed, the
+    sequence of latencies, errors and replies is reproducible.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 500.0,
+        distribution: str = "lognormal",
+        jitter: float = 0.5,
+        output_tokens: int = 256,
+        stream_chunks: int = 8,
+        chunk_delay_ms: float = 20.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+        model_name: str = "fake",
+    ):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{distribution}', expected one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.latency = latency_ms / 1000
+        self.distribution = distribution
+        self.jitter = jitter
+        self.output_tokens = output_tokens
+        self.stream_chunks = max(1, stream_chunks)
+        self.chunk_delay = chunk_delay_ms / 1000
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.model_name = model_name
+
+    def sample_latency(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        if self.distribution == "uniform":
+            return max(0.0, self.rng.uniform(self.latency * (1 - self.jitter), self.latency * (1 + self.jitter)))
+        if self.distribution == "exponential":
+            return self.rng.expovariate(1 / self.latency)
+        if self.distribution == "lognormal":
+            # Shift mu so the mean stays at latency whatever the spread.
+            return self.rng.lognormvariate(math.log(self.latency) - self.jitter ** 2 / 2, self.jitter)
+        return self.latency
+
+    def reply(self, prompt: str) -> str:
+        words = ["Fake", "reply", "to:", *prompt.split()[:8]]
+        filler = ("lorem", "ipsum", "dolor", "sit", "amet")
+        # About four characters per token, so one short word per token.
+        while len(words) < self.output_tokens:
+            words.append(filler[len(words) % len(filler)])
+        return " ".join(words[:max(self.output_tokens, 1)])
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        latency = self.sample_latency()
+        failed = self.error_rate > 0 and self.rng.random() < self.error_rate
+        text = self.reply(prompt)
+        prompt_tokens = max(1, len(prompt) // 4)
+
+        await asyncio.sleep(latency)
+        if failed:
+            raise ResourceExhausted("Fake model quota exceeded")
+
+        if not stream:
+            return FakeResponse(text, prompt_tokens, self.output_tokens)
+
+        size = math.ceil(len(text) / self.stream_chunks)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        return FakeStreamResponse(chunks, self.chunk_delay, prompt_tokens, self.output_tokens)
+
+
+class LazyModel:
+    """Stands in for a model whose client is built on first use, in a worker thread.
+
+    Building a Gemini client means importing google.generativeai, which
+    takes about a second; deferring it lets the worker start serving
+    before that. load() is also called in the background at startup, so
+    normally the client is ready before the first request needs it.
+    """
+
+    def __init__(self, factory: Callable[[], ModelProvider], model_name: str):
+        self.model_name = model_name
+        self._factory = factory
+        self._model: Optional[ModelProvider] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    async def load(self) -> ModelProvider:
+        if self._model is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._model is None:
+                    self._model = await asyncio.to_thread(self._factory)
+        return self._model
+
+    async def generate_content_async(self, prompt: str, stream: bool = False) -> Any:
+        model = await self.load()
+        return await model.generate_content_async(prompt, stream=stream)
+
+
+def check_model_settings(settings: Settings):
+    if settings.model_provider not in ("gemini", "fake"):
+        raise ValueError(f"Unknown model provider '{settings.model_provider}', expected 'gemini' or 'fake'")
+    if settings.model_provider == "gemini" and not settings.gemini_api_key:
+        raise ValueError("GEMINI_API_KEY is required for the gemini model provider")
+
+
+def create_model(settings: Settings, model_name: Optional[str] = None) -> ModelProvider:
+    model_name = model_name or settings.gemini_model
+    check_model_settings(settings)
+    if settings.model_provider == "fake":
+        logger.info(f"Using fake model provider for {model_name} ({settings.fake_model_latency_ms:.0f}ms {settings.fake_model_latency_distribution})")
+        return FakeModel(
+            latency_ms=settings.fake_model_latency_ms,
+            distribution=settings.fake_model_latency_distribution,
+            jitter=settings.fake_model_latency_jitter,
+            output_tokens=settings.fake_model_output_tokens,
+            stream_chunks=settings.fake_model_stream_chunks,
+            chunk_delay_ms=settings.fake_model_chunk_delay_ms,
+            error_rate=settings.fake_model_error_rate,
+            seed=settings.fake_model_seed,
+            model_name=model_name,
+        )
+
+    # Imported here: it is the slowest import in the app and only the gemini provider needs it.
+    import google.generativeai as genai
+
+    genai.configure(api_key=settings.gemini_api_key)
+    return genai.GenerativeModel(model_name)
+
+
+def create_models(settings: Settings, lazy: bool = False) -> dict[str, ModelProvider]:
+    """One client per routed model, plus the fallback model if it is not routed already.
+
+    With lazy, settings are still checked now but each client is a
+    LazyModel, built on first use or when its load() is awaited.
+    """
+    names = list(dict.fromkeys(settings.model_routes or [settings.gemini_model]))
+    if settings.model_fallback and settings.model_fallback not in names:
+        names.append(settings.model_fallback)
+    if lazy:
+        check_model_settings(settings)
+        return {name: LazyModel(functools.partial(create_model, settings, name), name) for name in names}
+    return {name: create_model(settings, name) for name in names}
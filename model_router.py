@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Callable, NamedTuple, Optional
+
+from google.api_core.exceptions import ResourceExhausted
+
+from metrics import metrics
+from model_provider import ModelProvider
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRoute(NamedTuple):
+    name: str
+    model: ModelProvider
+    cost: float = 1.0
+    max_prompt_chars: Optional[int] = None
+
+
+class RouteDecision(NamedTuple):
+    model: str
+    reason: str
+    hedged: bool = False
+
+
+class ModelStats:
+    """Live latency and error-rate EWMAs for one model, plus recent latencies for the hedge delay."""
+
+    def __init__(self, alpha: float, window: int):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.recent: deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+
+    def observe(self, latency: Optional[float], failed: bool):
+        self.calls += 1
+        self.errors += failed
+        self.error_rate += self.alpha * (float(failed) - self.error_rate)
+        if latency is None or failed:
+            return
+        self.recent.append(latency)
+        self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_ewma_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate_ewma": round(self.error_rate, 4)
+        }
+
+
+class ModelRouter:
+    """Picks a model per request and protects the call with hedging and fallback.
+
+    Candidates are ranked by expected cost in seconds: the latency EWMA,
+    plus error_penalty times the error-rate EWMA, plus cost_weight times
+    the model's relative price for the prompt's length. Models whose
+    max_prompt_chars is below the prompt length are skipped, and untried
+    models rank first so every candidate gets measured; explore_rate of
+    requests go to a random candidate so recovered models are noticed.
+
+    When the chosen model has not answered after its recent hedge_percentile
+    latency, a backup request goes to the next-ranked model (or the same
+    one) and whichever answers first wins. Hedges only fire while
+    take_hedge_budget(prompt) allows them, so they cannot eat the quota live
+    traffic needs. On ResourceExhausted the call moves to the fallback
+    model, or else to the cheapest candidate that costs less. A pinned
+    model is never swapped for another one.
+    """
+
+    def __init__(
+        self,
+        routes: list[ModelRoute],
+        fallback: Optional[str] = None,
+        cost_weight: float = 0.5,
+        error_penalty: float = 10.0,
+        ewma_alpha: float = 0.2,
+        explore_rate: float = 0.05,
+        hedge_enabled: bool = True,
+        hedge_percentile: float = 95.0,
+        hedge_min_delay: float = 0.1,
+        hedge_min_samples: int = 20,
+        latency_window: int = 200,
+        take_hedge_budget: Callable[[str], bool] = lambda prompt: True,
+        seed: Optional[int] = None,
+    ):
+        if not routes:
+            raise ValueError("ModelRouter needs at least one model")
+        self.routes = {route.name: route for route in routes}
+        self.fallback = fallback if fallback in self.routes else None
+        # The fallback model only serves when the routed ones are out of quota, unless it is all there is.
+        self.candidates = [name for name in self.routes if name != self.fallback] or list(self.routes)
+        self.cost_weight = cost_weight
+        self.error_penalty = error_penalty
+        self.explore_rate = explore_rate
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.take_hedge_budget = take_hedge_budget
+        self.stats = {name: ModelStats(ewma_alpha, latency_window) for name in self.routes}
+        self.rng = random.Random(seed)
+        self.hedges = {"started": 0, "won": 0}
+        self.fallbacks = 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.routes
+
+    def score(self, route: ModelRoute, prompt: str) -> float:
+        stats = self.stats[route.name]
+        if stats.latency is None:
+            return float("-inf")
+        prompt_tokens = len(prompt) / 4
+        return (
+            stats.latency
+            + self.error_penalty * stats.error_rate
+            + self.cost_weight * route.cost * prompt_tokens / 1000
+        )
+
+    def rank(self, prompt: str, pinned: Optional[str] = None) -> list[ModelRoute]:
+        if pinned is not None:
+            return [self.routes[pinned]]
+
+        routes = [self.routes[name] for name in self.candidates]
+        eligible = [r for r in routes if r.max_prompt_chars is None or len(prompt) <= r.max_prompt_chars] or routes
+        ranked = sorted(eligible, key=lambda route: self.score(route, prompt))
+        if len(ranked) > 1 and self.rng.random() < self.explore_rate:
+            ranked.insert(0, ranked.pop(self.rng.randrange(1, len(ranked))))
+        return ranked
+
+    def hedge_delay(self, route: ModelRoute) -> Optional[float]:
+        stats = self.stats[route.name]
+        if not self.hedge_enabled or len(stats.recent) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, stats.percentile(self.hedge_percentile))
+
+    def fallback_for(self, route: ModelRoute) -> Optional[ModelRoute]:
+        if self.fallback is not None and self.fallback != route.name:
+            return self.routes[self.fallback]
+        cheaper = [self.routes[name] for name in self.candidates if self.routes[name].cost < route.cost]
+        return min(cheaper, key=lambda r: r.cost) if cheaper else None
+
+    async def _call(self, route: ModelRoute, prompt: str, stream: bool = False) -> Any:
+        start = time.perf_counter()
+        try:
+            response = await route.model.generate_content_async(prompt, stream=stream)
+        except Exception:
+            self.stats[route.name].observe(None, failed=True)
+            metrics.increment('gemini_chat_api.llm.model.errors', tags=(f'model:{route.name}',))
+            raise
+
+        latency = time.perf_counter() - start
+        # A stream returns at its first chunk, which is not comparable with a full reply.
+        self.stats[route.name].observe(None if stream else latency, failed=False)
+        if not stream:
+            metrics.histogram('gemini_chat_api.llm.model.latency', latency, tags=(f'model:{route.name}',))
+        return response
+
+    async def _hedged_call(self, primary: ModelRoute, backup: ModelRoute, prompt: str) -> tuple[Any, ModelRoute, bool]:
+        tasks = {asyncio.ensure_future(self._call(primary, prompt)): primary}
+        try:
+            delay = self.hedge_delay(primary)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.take_hedge_budget(prompt):
+                    self.hedges["started"] += 1
+                    metrics.increment('gemini_chat_api.llm.hedge.started', tags=(f'model:{backup.name}',))
+                    tasks[asyncio.ensure_future(self._call(backup, prompt))] = backup
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        hedged = len(tasks) > 1
+                        if hedged and task is not next(iter(tasks)):
+                            self.hedges["won"] += 1
+                            metrics.increment('gemini_chat_api.llm.hedge.won', tags=(f'model:{tasks[task].name}',))
+                        return task.result(), tasks[task], hedged
+
+            # Every attempt failed; surface the primary's error so fallback sees ResourceExhausted.
+            raise next(iter(tasks)).exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def generate(self, prompt: str, pinned: Optional[str] = None) -> tuple[Any, RouteDecision]:
+        ranked = self.rank(prompt, pinned)
+        primary = ranked[0]
+        backup = ranked[1] if len(ranked) > 1 else primary
+        reason = "pinned" if pinned is not None else "ranked"
+
+        try:
+            response, served, hedged = await self._hedged_call(primary, backup, prompt)
+            if served is not primary:
+                reason = "hedge"
+        except ResourceExhausted:
+            fallback = self.fallback_for(primary) if pinned is None else None
+            if fallback is None:
+                raise
+            response, served, hedged, reason = await self._fallback(primary, fallback, prompt), fallback, False, "fallback"
+
+        decision = RouteDecision(served.name, reason, hedged)
+        metrics.increment('gemini_chat_api.llm.route', tags=(f'model:{served.name}', f'reason:{reason}'))
+        return response, decision
+
+    async def open_stream(self, prompt: str, pinned: Optional[str] = None) -> tuple[Any, RouteDecision]:
+        """Starts a streamed reply. Streams are not hedged, but fall back like unary calls."""
+        primary = self.rank(prompt, pinned)[0]
+        reason = "pinned" if pinned is not None else "ranked"
+
+        try:
+            response, served = await self._call(primary, prompt, stream=True), primary
+        except ResourceExhausted:
+            fallback = self.fallback_for(primary) if pinned is None else None
+            if fallback is None:
+                raise
+            response, served, reason = await self._fallback(primary, fallback, prompt, stream=True), fallback, "fallback"
+
+        decision = RouteDecision(served.name, reason)
+        metrics.increment('gemini_chat_api.llm.route', tags=(f'model:{served.name}', f'reason:{reason}'))
+        return response, decision
+
+    async def _fallback(self, primary: ModelRoute, fallback: ModelRoute, prompt: str, stream: bool = False) -> Any:
+        self.fallbacks += 1
+        metrics.increment('gemini_chat_api.llm.fallback', tags=(f'from:{primary.name}', f'to:{fallback.name}'))
+        logger.warning("Model %s is out of quota, falling back to %s", primary.name, fallback.name)
+        return await self._call(fallback, prompt, stream=stream)
+
+    def snapshot(self) -> dict:
+        return {
+            "candidates": self.candidates,
+            "fallback": self.fallback,
+            "hedges": dict(self.hedges),
+            "fallbacks": self.fallbacks,
+            "models": {name: stats.snapshot() for name, stats in self.stats.items()}
+        }
@@ -0,0 +1,43 @@
+import re
+import string
+from typing import Callable, Iterable
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+
+def _collapse_whitespace(prompt: str) -> str:
+    return _WHITESPACE_RE.sub(" ", prompt).strip()
+
+
+def _fold_case(prompt: str) -> str:
+    return prompt.casefold()
+
+
+def _strip_punctuation(prompt: str) -> str:
+    return prompt.translate(_PUNCTUATION_TABLE)
+
+
+NORMALIZERS: dict[str, Callable[[str], str]] = {
+    "whitespace": _collapse_whitespace,
+    "case": _fold_case,
+    "punctuation": _strip_punctuation,
+}
+
+
+def build_normalizer(steps: Iterable[str]) -> Callable[[str], str]:
+    unknown = [step for step in steps if step not in NORMALIZERS]
+    if unknown:
+        raise ValueError(f"Unknown prompt normalization steps: {unknown}")
+
+    pipeline = [NORMALIZERS[step] for step in steps]
+    # Punctuation removal can leave doubled spaces, so whitespace always runs last.
+    if "whitespace" in steps and "punctuation" in steps:
+        pipeline.append(_collapse_whitespace)
+
+    def normalize(prompt: str) -> str:
+        for step in pipeline:
+            prompt = step(prompt)
+        return prompt
+
+    return normalize
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable
+
+from google.api_core.exceptions import (
+    DeadlineExceeded,
+    InternalServerError,
+    ResourceExhausted,
+    ServiceUnavailable,
+)
+
+from admission import FairScheduler
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_ERRORS = (ResourceExhausted, ServiceUnavailable, InternalServerError, DeadlineExceeded)
+
+
+class QuotaExceeded(Exception):
+    """Raised when a call is shed before reaching the model."""
+
+
+class TokenBucket:
+    def __init__(self, capacity_per_minute: int):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+
+class RateGovernor:
+    """Client-side request and token budgets for the Gemini quota.
+
+    Callers wait their turn, round-robin per user, until both the
+    requests-per-minute and tokens-per-minute buckets can cover them, so a
+    user with a long backlog does not hold back everyone else's calls when
+    the budget is the bottleneck. Work is shed with
+    QuotaExceeded when the queue is full or the wait would exceed
+    max_queue_wait, so excess load fails fast instead of piling up 429s.
+    Transient upstream errors are retried with full-jitter exponential
+    backoff, and a ResourceExhausted pauses every caller, not just the one
+    that hit it.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_queue: int,
+        max_queue_wait: float,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        tags: tuple[str, ...] = (),
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.tags = tags
+        self.queue_depth = 0
+        self.shed_count = 0
+        self.avg_output_tokens = 256.0
+        self._paused_until = 0.0
+        self._turns = FairScheduler(1)
+
+    def estimate_tokens(self, prompt: str) -> int:
+        return len(prompt) // 4 + int(self.avg_output_tokens)
+
+    def retry_after(self) -> float:
+        return max(
+            self.requests.time_until(1),
+            self.tokens.time_until(self.avg_output_tokens),
+            self._paused_until - time.monotonic(),
+            0.0,
+        )
+
+    def has_headroom(self, reserve_fraction: float) -> bool:
+        """True when nobody is queued and one more call leaves reserve_fraction of both budgets free."""
+        if self.queue_depth > 0 or self._paused_until > time.monotonic():
+            return False
+        return (
+            self.requests.time_until(1 + self.requests.capacity * reserve_fraction) == 0
+            and self.tokens.time_until(self.avg_output_tokens + self.tokens.capacity * reserve_fraction) == 0
+        )
+
+    def try_acquire(self, estimated_tokens: int, reserve_fraction: float) -> bool:
+        """Reserves budget for an optional call without queueing, only when has_headroom allows it."""
+        if not self.has_headroom(reserve_fraction):
+            return False
+        self.requests.consume(1)
+        self.tokens.consume(estimated_tokens)
+        return True
+
+    def _shed(self, reason: str):
+        self.shed_count += 1
+        metrics.increment('gemini_chat_api.llm.governor.shed', tags=self.tags + (f'reason:{reason}',))
+        raise QuotaExceeded(f"LLM request shed: {reason}")
+
+    async def acquire(self, estimated_tokens: int, user_id: str = ""):
+        if self.queue_depth >= self.max_queue:
+            self._shed("queue_full")
+
+        self.queue_depth += 1
+        metrics.gauge('gemini_chat_api.llm.governor.queue_depth', self.queue_depth, tags=self.tags)
+        start = time.monotonic()
+        try:
+            async with self._turns.slot(user_id):
+                wait = max(
+                    self.requests.time_until(1),
+                    self.tokens.time_until(estimated_tokens),
+                    self._paused_until - time.monotonic(),
+                )
+                if wait > self.max_queue_wait - (time.monotonic() - start):
+                    self._shed("budget")
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                self.requests.consume(1)
+                self.tokens.consume(estimated_tokens)
+        finally:
+            self.queue_depth -= 1
+            metrics.gauge('gemini_chat_api.llm.governor.queue_depth', self.queue_depth, tags=self.tags)
+            metrics.histogram('gemini_chat_api.llm.governor.wait_seconds', time.monotonic() - start, tags=self.tags)
+
+    def settle(self, estimated_tokens: int, total_tokens: int, output_tokens: int):
+        if total_tokens <= 0:
+            return
+
+        self.tokens.refund(estimated_tokens - total_tokens)
+        self.avg_output_tokens = 0.9 * self.avg_output_tokens + 0.1 * output_tokens
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int, user_id: str = "") -> Any:
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(estimated_tokens, user_id)
+            try:
+                return await fn()
+            except TRANSIENT_ERRORS as e:
+                # Nothing was generated, so the reservation goes back into the budget.
+                self.tokens.refund(estimated_tokens)
+                if attempt == self.max_retries:
+                    raise
+
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if isinstance(e, ResourceExhausted):
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+                metrics.increment('gemini_chat_api.llm.governor.retries', tags=self.tags + (f'error:{type(e).__name__}',))
+                logger.warning("Transient LLM error (%s), retry %s/%s in %.2fs", type(e).__name__, attempt + 1, self.max_retries, delay)
+                await asyncio.sleep(delay)
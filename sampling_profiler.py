@@ -0,0 +1,70 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    """Statistical profiler for a running worker, with no tracing hooks on the profiled code.
+
+    A background thread wakes every interval seconds and records the stack
+    of the target thread (by default the one that created the profiler,
+    i.e. the event loop) via sys._current_frames(). Coroutines show up under
+    the event loop frames while they run; time spent waiting in select()
+    is idle time. Stacks are returned in the collapsed format
+    ("root;child;leaf count" per line) that flamegraph.pl and speedscope
+    turn into flame graphs.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None, all_threads: bool = False):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.all_threads = all_threads
+        self.samples: Counter[str] = Counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (not self.all_threads and thread_id != self.thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    async def profile(self, seconds: float) -> str:
+        self.start()
+        started = time.perf_counter()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.stop()
+        self.duration = time.perf_counter() - started
+        return self.folded()
@@ -0,0 +1,76 @@
+import zlib
+from typing import Optional
+
+import numpy as np
+
+
+def embed_prompt(prompt: str, dimensions: int) -> np.ndarray:
+    """Embeds a prompt with signed feature hashing of words and character trigrams.
+
+    This is a purely local, deterministic embedding: prompts that share most
+    of their words and spelling land close together, which is enough to catch
+    rephrasings such as reordered clauses or a changed filler word.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    words = prompt.split()
+    padded = f" {' '.join(words)} "
+    features = words + [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    for feature in features:
+        digest = zlib.crc32(feature.encode('utf-8'))
+        sign = 1.0 if digest & 0x80000000 else -1.0
+        vector[digest % dimensions] += sign
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class SemanticIndex:
+    """Fixed-capacity cosine-similarity index from prompt embeddings to cache keys.
+
+    Vectors live in one preallocated matrix so a lookup is a single
+    matrix-vector product. Once full, the oldest entry is overwritten.
+    """
+
+    def __init__(self, max_entries: int, dimensions: int, threshold: float):
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+        self.threshold = threshold
+        self._vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self._keys: list[Optional[str]] = [None] * max_entries
+        self._positions: dict[str, int] = {}
+        self._next = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, prompt: str, cache_key: str):
+        if self.max_entries <= 0 or cache_key in self._positions:
+            return
+
+        position = self._next
+        evicted = self._keys[position]
+        if evicted is not None:
+            del self._positions[evicted]
+
+        self._vectors[position] = embed_prompt(prompt, self.dimensions)
+        self._keys[position] = cache_key
+        self._positions[cache_key] = position
+        self._next = (position + 1) % self.max_entries
+        self._size = min(self._size + 1, self.max_entries)
+
+    def lookup(self, prompt: str) -> Optional[tuple[str, float]]:
+        if self._size == 0:
+            return None
+
+        query = embed_prompt(prompt, self.dimensions)
+        scores = self._vectors[:self._size] @ query
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+
+        if score < self.threshold:
+            return None
+        return self._keys[best], score
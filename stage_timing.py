@@ -0,0 +1,98 @@
+import math
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from ddtrace import tracer
+
+from metrics import metrics
+
+
+class LatencyHistogram:
+    """HDR-style histogram with log-spaced buckets: constant memory, bounded relative error.
+
+    Values are recorded in microseconds into buckets that grow by a factor
+    of (1 + precision), so any percentile is accurate to within precision
+    (1% by default) from 1us up to max_seconds, whatever the sample count.
+    """
+
+    def __init__(self, precision: float = 0.01, max_seconds: float = 600.0):
+        self._log_base = math.log1p(precision)
+        self._counts = [0] * (self._bucket(max_seconds * 1e6) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, micros: float) -> int:
+        return int(math.log(max(micros, 1.0)) / self._log_base)
+
+    def record(self, seconds: float):
+        bucket = min(self._bucket(seconds * 1e6), len(self._counts) - 1)
+        self._counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for bucket, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                # Report the bucket's midpoint, capped by the largest value actually seen.
+                return min(math.exp((bucket + 0.5) * self._log_base) / 1e6, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p90_ms": round(self.percentile(90) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+
+class StageTimer:
+    """Times the stages of a request as ddtrace child spans, DogStatsD histograms and local histograms.
+
+    The local histograms cover everything since startup (or the last reset)
+    in this worker and back /debug/latency, so a stage breakdown is
+    available without going through the tracing backend.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self.started = time.time()
+        self._tags: dict[str, tuple[str, ...]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            with tracer.trace(f"{self.prefix}.{name}", resource=name):
+                yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+            self._tags[name] = (f'stage:{name}',)
+        histogram.record(seconds)
+        metrics.histogram(f'gemini_chat_api.{self.prefix}.stage.duration', seconds, tags=self._tags[name])
+
+    def summary(self) -> dict:
+        return {
+            "since": self.started,
+            "stages": {name: histogram.summary() for name, histogram in self.histograms.items()}
+        }
+
+    def reset(self):
+        self.histograms.clear()
+        self.started = time.time()
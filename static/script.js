@@ -5,16 +5,46 @@ const chatContainer = document.querySelector(".chat-container");
 const userId = 'user_' + Math.random().toString(36).substr(2, 9);
 let userText = null;
 
-let lastMessageCount = 0;
+const MAX_RENDERED_MESSAGES = 50;
+let historyCursor = null;
 let isLoadingHistory = false;
 
+const addHistoryMessages = (messages) => {
+    if (!messages || messages.length === 0) return;
+    
+    historyCursor = messages[messages.length - 1].id;
+    
+    // This tab already shows its own messages, rendered as they were sent and streamed.
+    const newMessages = messages.filter(msg => msg.user_id !== userId);
+    if (newMessages.length === 0) return;
+    
+    removeWelcomeScreen();
+    
+    newMessages.forEach(msg => {
+        const className = msg.role === "user" ? "outgoing" : "incoming";
+        const html = `<p>${msg.content}</p>`;
+        const chatDiv = createChatElement(html, className);
+        chatContainer.appendChild(chatDiv);
+    });
+    
+    const chatWrappers = chatContainer.querySelectorAll('.chat-wrapper');
+    for (let i = 0; i < chatWrappers.length - MAX_RENDERED_MESSAGES; i++) {
+        chatWrappers[i].remove();
+    }
+    
+    chatContainer.scrollTo({ top: chatContainer.scrollHeight, behavior: 'smooth' });
+}
+
 async function loadChatHistory() {
     if (isLoadingHistory) return;
     
     isLoadingHistory = true;
     
     try {
-        const response = await fetch('/history', {
+        const url = historyCursor
+            ? `/history?cursor=${encodeURIComponent(historyCursor)}&limit=${MAX_RENDERED_MESSAGES}`
+            : `/history?limit=${MAX_RENDERED_MESSAGES}`;
+        const response = await fetch(url, {
             method: 'GET',
             headers: {
                 'Content-Type': 'application/json',
@@ -26,28 +56,7 @@ async function loadChatHistory() {
         }
         
         const data = await response.json();
-        
-        if (data.messages && data.messages.length > 0) {
-            if (data.messages.length !== lastMessageCount) {
-                removeWelcomeScreen();
-                
-                const welcomeScreen = chatContainer.querySelector('.welcome-screen');
-                if (!welcomeScreen) {
-                    chatContainer.innerHTML = '';
-                }
-                
-                data.messages.forEach(msg => {
-                    const className = msg.role === "user" ? "outgoing" : "incoming";
-                    const html = `<p>${msg.content}</p>`;
-                    const chatDiv = createChatElement(html, className);
-                    chatContainer.appendChild(chatDiv);
-                });
-                
-                lastMessageCount = data.messages.length;
-                
-                chatContainer.scrollTo({ top: chatContainer.scrollHeight, behavior: 'smooth' });
-            }
-        }
+        addHistoryMessages(data.messages);
     } catch (error) {
         console.error('AJAX request failed:', error);
     } finally {
@@ -55,8 +64,9 @@ async function loadChatHistory() {
     }
 }
 
-document.addEventListener('DOMContentLoaded', () => {
-    loadChatHistory();
+document.addEventListener('DOMContentLoaded', async () => {
+    await loadChatHistory();
+    subscribeToChatHistory();
     if (typeof lucide !== 'undefined') {
         lucide.createIcons();
     }
@@ -97,8 +107,23 @@ const removeWelcomeScreen = () => {
     }
 }
 
+const parseServerSentEvent = (rawEvent) => {
+    let type = "message";
+    let data = "";
+
+    rawEvent.split("\n").forEach(line => {
+        if (line.startsWith("event:")) {
+            type = line.slice(6).trim();
+        } else if (line.startsWith("data:")) {
+            data += line.slice(5).trim();
+        }
+    });
+
+    return { type, data: data ? JSON.parse(data) : {} };
+}
+
 const getChatResponse = async (incomingChatDiv) => {
-    const API_URL = "/chat";
+    const API_URL = "/chat/stream";
     const chatDetails = incomingChatDiv.querySelector(".chat-details");
 
     try {
@@ -113,17 +138,38 @@ const getChatResponse = async (incomingChatDiv) => {
             })
         });
         
-        const data = await response.json();
-        
         if (!response.ok) {
+            const data = await response.json();
             throw new Error(data.detail || "Something went wrong");
         }
         
-        chatDetails.innerHTML = `<p>${data.response}</p>`;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let responseText = "";
         
-        setTimeout(() => {
-            loadChatHistory();
-        }, 1000);
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            const rawEvents = buffer.split("\n\n");
+            buffer = rawEvents.pop();
+            
+            for (const rawEvent of rawEvents) {
+                const event = parseServerSentEvent(rawEvent);
+                
+                if (event.type === "error") {
+                    throw new Error(event.data.detail || "Something went wrong");
+                }
+                
+                if (event.type === "message") {
+                    responseText += event.data.text;
+                    chatDetails.innerHTML = `<p>${responseText}</p>`;
+                    chatContainer.scrollTo({ top: chatContainer.scrollHeight, behavior: 'smooth' });
+                }
+            }
+        }
         
     } catch (error) {
         console.error('AJAX chat request failed:', error);
@@ -190,11 +236,30 @@ chatInput.addEventListener("input", () => {
 
 const POLL_INTERVAL = 3000;
 
-setInterval(() => {
-    loadChatHistory();
-}, POLL_INTERVAL);
-
-console.log(`🔄 AJAX polling enabled: fetching message logs every ${POLL_INTERVAL/1000}s`);
+function subscribeToChatHistory() {
+    if (typeof EventSource === 'undefined') {
+        setInterval(() => {
+            loadChatHistory();
+        }, POLL_INTERVAL);
+        console.log(`🔄 AJAX polling enabled: fetching new messages every ${POLL_INTERVAL/1000}s`);
+        return;
+    }
+    
+    const url = historyCursor
+        ? `/history/stream?cursor=${encodeURIComponent(historyCursor)}`
+        : '/history/stream';
+    const source = new EventSource(url);
+    
+    source.onmessage = (event) => {
+        addHistoryMessages([JSON.parse(event.data)]);
+    };
+    
+    source.onerror = () => {
+        console.warn('History stream interrupted, reconnecting...');
+    };
+    
+    console.log('📡 Push updates enabled: streaming new messages from /history/stream');
+}
 
 let trafficBtn;
 let loadingOverlay;
@@ -1,12 +1,13 @@
 from datetime import datetime, timezone, timedelta
-from pythonjsonlogger import jsonlogger
+from pythonjsonlogger.json import JsonFormatter
 
+SGT = timezone(timedelta(hours=8))
 
-class SingaporeJsonFormatter(jsonlogger.JsonFormatter):
+
+class SingaporeJsonFormatter(JsonFormatter):
     def add_fields(self, log_record, record, message_dict):
         super(SingaporeJsonFormatter, self).add_fields(log_record, record, message_dict)
         
         if self.timestamp:
-            sgt_zone = timezone(timedelta(hours=8))
-            now = datetime.now(sgt_zone)
-            log_record['timestamp'] = now.isoformat()
\ No newline at end of file
+            # The record's own creation time, not the time the listener thread gets to it.
+            log_record['timestamp'] = datetime.fromtimestamp(record.created, SGT).isoformat()
\ No newline at end of file
@@ -1,17 +1,37 @@
+"""Load generator for the chat API.
+
+Sends weighted prompt scenarios to /chat, either closed-loop (a fixed number
+of concurrent clients, each sending its next request when the previous one
+returns) or open-loop (requests start at a constant arrival rate whether or
+not earlier ones have finished). It reports throughput plus p50/p95/p99
+latency split by outcome: cache hit, model call, blocked prompt, rate
+limited and error.
+
+    python traffic.py                                  # 20 requests against API_URL
+    python traffic.py --mode open --rate 50 --duration 30
+    python traffic.py --offline --mode closed --concurrency 64 --requests 5000
+
+--offline runs the app in-process with a fake model and no Redis, so it
+needs no network access or API key. In open-loop mode latency is measured
+from each request's scheduled start, so a slow server cannot hide queueing
+delay by holding back the next send.
+"""
+import argparse
+import asyncio
 import logging
 import os
 import random
 import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, NamedTuple, Optional
 
-import requests
+import httpx
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 API_URL = os.environ.get("API_URL", os.environ.get("API_HOST", "http://localhost:8000"))
 if not API_URL.startswith("http"):
     API_URL = f"http://{API_URL}:8000"
-URL = f"{API_URL}/chat"
 
 NORMAL_PROMPTS = [
     "Explain quantum physics like I'm 5.",
@@ -43,67 +63,271 @@ FRUSTRATED_PROMPTS = [
     "This is the worst experience I have ever had.",
 ]
 
-def send_traffic():
-    NUM_REQUESTS = 20
-    DELAY_BETWEEN_REQUESTS = 2
-    
-    logger.info(f"Starting traffic generator - will send {NUM_REQUESTS} requests")
-    
-    for count in range(1, NUM_REQUESTS + 1):
-        
-        if random.random() < 0.5:
-            current_user = "user_sg_123"  # Contains 'sg', triggers Southeast Asia tag
-            region_code = "sg"
-        else:
-            current_user = "user_us_567"  # No 'sg', triggers North America tag    
-            region_code = "us"
-        
-        rand_mode = random.random()
-        
-        if rand_mode < 0.4:
-            mode = "BIAS TEST"
-            if region_code == "us":
-                prompt = random.choice(HAPPY_PROMPTS)
-                logger.info(f"[{count}/{NUM_REQUESTS}] {mode} - HAPPY: {prompt[:50]}")
-            else:
-                prompt = random.choice(FRUSTRATED_PROMPTS)
-                logger.info(f"[{count}/{NUM_REQUESTS}] {mode} - FRUSTRATED: {prompt[:50]}")
-                
-        else:
-        
-            if random.random() < 0.2:
-                mode = "NORMAL USAGE"
-                prompt = random.choice(NORMAL_PROMPTS)
-                logger.info(f"[{count}/{NUM_REQUESTS}] NORMAL: {prompt[:50]}")
-            else:
-                mode = "SECURITY TEST"
-                prompt = JAILBREAK_PROMPT
-                logger.warning(f"[{count}/{NUM_REQUESTS}] ATTACK: {prompt[:50]}")
-            
-
-        
+OUTCOMES = ["hit", "miss", "blocked", "rate_limited", "error"]
+SOURCE_OUTCOMES = {"cache": "hit", "model": "miss", "blocked": "blocked"}
+
+
+class Scenario(NamedTuple):
+    prompts: list[str]
+    regions: tuple[str, ...]
+
+
+# The bias test sends happy prompts from US users and frustrated prompts from
+# Singapore users ('sg' in the user id triggers the Southeast Asia tag).
+SCENARIOS = {
+    "normal": Scenario(NORMAL_PROMPTS, ("sg", "us")),
+    "happy": Scenario(HAPPY_PROMPTS, ("us",)),
+    "frustrated": Scenario(FRUSTRATED_PROMPTS, ("sg",)),
+    "jailbreak": Scenario([JAILBREAK_PROMPT], ("sg", "us")),
+}
+
+DEFAULT_MIX = "normal=0.12,happy=0.2,frustrated=0.2,jailbreak=0.48"
+
+
+class Result(NamedTuple):
+    scenario: str
+    outcome: str
+    latency: float
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}', expected one of {', '.join(SCENARIOS)}")
+        weights[name] = float(weight)
+    if sum(weights.values()) <= 0:
+        raise ValueError("Scenario weights must add up to more than zero")
+    return weights
+
+
+class RequestPicker:
+    def __init__(self, mix: dict[str, float], users: int, rng: random.Random):
+        self.names = list(mix)
+        self.weights = list(mix.values())
+        self.users = users
+        self.rng = rng
+
+    def next(self) -> tuple[str, dict]:
+        name = self.rng.choices(self.names, self.weights)[0]
+        scenario = SCENARIOS[name]
+        region = self.rng.choice(scenario.regions)
+        user_id = f"user_{region}_{self.rng.randrange(self.users)}"
+        return name, {"prompt": self.rng.choice(scenario.prompts), "user_id": user_id}
+
+
+async def send(client: httpx.AsyncClient, scenario: str, payload: dict, started: float) -> Result:
+    try:
+        response = await client.post("/chat", json=payload)
+    except httpx.HTTPError as e:
+        logger.debug(f"Request failed: {e}")
+        return Result(scenario, "error", time.perf_counter() - started)
+
+    latency = time.perf_counter() - started
+    if response.status_code == 200:
+        outcome = SOURCE_OUTCOMES.get(response.headers.get("X-Response-Source"), "miss")
+    elif response.status_code == 429:
+        outcome = "rate_limited"
+    else:
+        outcome = "error"
+    return Result(scenario, outcome, latency)
+
+
+async def run_closed_loop(client, picker: RequestPicker, concurrency: int, requests: Optional[int], duration: Optional[float]) -> list[Result]:
+    results: list[Result] = []
+    deadline = time.perf_counter() + duration if duration else None
+    remaining = [requests]
+
+    async def worker():
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if remaining[0] is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            scenario, payload = picker.next()
+            results.append(await send(client, scenario, payload, time.perf_counter()))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def run_open_loop(client, picker: RequestPicker, rate: float, requests: Optional[int], duration: Optional[float], poisson: bool) -> list[Result]:
+    total = requests if requests is not None else int(rate * duration)
+    start = time.perf_counter()
+    tasks = []
+    scheduled = 0.0
+
+    for _ in range(total):
+        scheduled += picker.rng.expovariate(rate) if poisson else 1 / rate
+        delay = start + scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        scenario, payload = picker.next()
+        tasks.append(asyncio.create_task(send(client, scenario, payload, start + scheduled)))
+
+    return list(await asyncio.gather(*tasks))
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(results: list[Result], elapsed: float) -> dict:
+    groups: dict[str, list[float]] = {outcome: [] for outcome in OUTCOMES}
+    for result in results:
+        groups[result.outcome].append(result.latency)
+    groups["all"] = [result.latency for result in results]
+
+    breakdown = {}
+    for outcome, latencies in groups.items():
+        latencies.sort()
+        breakdown[outcome] = {
+            "count": len(latencies),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+
+    return {
+        "requests": len(results),
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(results) / elapsed if elapsed > 0 else 0.0,
+        "outcomes": breakdown,
+    }
+
+
+def print_report(summary: dict, description: str):
+    print(description)
+    print(f"{summary['requests']} requests in {summary['elapsed_seconds']:.2f}s, "
+          f"{summary['throughput_rps']:.1f} req/s")
+    print(f"{'outcome':>13} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for outcome, stats in summary["outcomes"].items():
+        if stats["count"] == 0 and outcome != "all":
+            continue
+        print(f"{outcome:>13} {stats['count']:>7} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+@asynccontextmanager
+async def offline_transport(model_latency: float, seed: Optional[int] = None) -> AsyncIterator[httpx.AsyncBaseTransport]:
+    os.environ.setdefault("MODEL_PROVIDER", "fake")
+    import cache
+    import main
+    from model_provider import FakeModel
+
+    async def no_redis():
+        return None
+
+    cache.get_redis_client = no_redis
+    main.get_redis_client = no_redis
+
+    async with main.lifespan(main.app):
+        main.app.state.model_router = main.create_model_router({"fake": FakeModel(latency_ms=model_latency * 1000, seed=seed)})
+        yield httpx.ASGITransport(app=main.app)
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float):
+    """Polls /health/ready until the API answers 200, so a load run started alongside it does not fail on connect."""
+    deadline = time.perf_counter() + timeout
+    while True:
         try:
-            resp = requests.post(URL, json={"prompt": prompt, "user_id": current_user}, timeout=30)
-            
-            if resp.status_code == 200:
-                result = resp.json()
-                logger.info(f"Success - Response: {result.get('response', '')[:100]}")
-            elif resp.status_code == 429:
-                logger.warning("Rate limited - waiting 10s before continuing...")
-                time.sleep(10)
-            else:
-                logger.error(f"Error {resp.status_code}: {resp.text[:100]}")
-                
-        except requests.exceptions.ConnectionError:
-            logger.error("Connection failed - API may not be ready yet")
-        except Exception as e:
-            logger.error(f"Request failed: {e}")
-        
-        if count < NUM_REQUESTS:
-            time.sleep(DELAY_BETWEEN_REQUESTS)
-    
-    logger.info(f"Traffic generator completed - sent {NUM_REQUESTS} requests")
+            if (await client.get("/health/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.perf_counter() >= deadline:
+            raise RuntimeError(f"API not ready after {timeout:.0f}s")
+        await asyncio.sleep(1.0)
+
+
+async def run_load(
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+    base_url: str = API_URL,
+    mode: str = "closed",
+    concurrency: int = 4,
+    rate: float = 10.0,
+    requests: Optional[int] = None,
+    duration: Optional[float] = None,
+    mix: str = DEFAULT_MIX,
+    users: int = 100,
+    poisson: bool = False,
+    timeout: float = 30.0,
+    seed: Optional[int] = None,
+    wait_ready: float = 0.0,
+) -> dict:
+    if requests is None and duration is None:
+        raise ValueError("Either requests or duration is required")
+
+    picker = RequestPicker(parse_mix(mix), users, random.Random(seed))
+    limits = httpx.Limits(max_connections=None if mode == "open" else concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=timeout, limits=limits) as client:
+        if wait_ready > 0:
+            logger.info(f"Waiting up to {wait_ready:.0f}s for {base_url} to be ready")
+            await wait_until_ready(client, wait_ready)
+        start = time.perf_counter()
+        if mode == "open":
+            results = await run_open_loop(client, picker, rate, requests, duration, poisson)
+        else:
+            results = await run_closed_loop(client, picker, concurrency, requests, duration)
+        elapsed = time.perf_counter() - start
+
+    return summarize(results, elapsed)
+
+
+async def main_async(args):
+    options = dict(
+        mode=args.mode,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        requests=args.requests,
+        duration=args.duration,
+        mix=args.mix,
+        users=args.users,
+        poisson=args.poisson,
+        timeout=args.timeout,
+        seed=args.seed,
+    )
+    load = f"{args.concurrency} clients" if args.mode == "closed" else f"{args.rate:g} req/s"
+
+    if args.offline:
+        logging.getLogger().setLevel(logging.ERROR)
+        async with offline_transport(args.model_latency, args.seed) as transport:
+            summary = await run_load(transport=transport, base_url="http://offline", **options)
+        target = f"in-process app, fake model ({args.model_latency * 1000:.0f}ms mean)"
+    else:
+        summary = await run_load(base_url=args.url, wait_ready=args.wait_ready, **options)
+        target = args.url
+
+    print_report(summary, f"{args.mode}-loop, {load} against {target}")
 
 
 if __name__ == "__main__":
-    send_traffic()
+    parser = argparse.ArgumentParser(description="Load generator for the chat API")
+    parser.add_argument("--url", default=API_URL)
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clients in closed-loop mode")
+    parser.add_argument("--rate", type=float, default=10.0, help="Arrivals per second in open-loop mode")
+    parser.add_argument("--poisson", action="store_true", help="Exponential inter-arrival times in open-loop mode")
+    parser.add_argument("--requests", type=int, default=None)
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to run instead of a request count")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. normal=1,jailbreak=0.1")
+    parser.add_argument("--users", type=int, default=100, help="Distinct user ids per region")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--wait-ready", type=float, default=60.0, help="Seconds to wait for /health/ready before starting; 0 to skip")
+    parser.add_argument("--offline", action="store_true", help="Run against the app in-process with a fake model")
+    parser.add_argument("--model-latency", type=float, default=0.5, help="Fake model mean latency in seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.requests is None and args.duration is None:
+        args.requests = 20
+
+    asyncio.run(main_async(args))